@@ -0,0 +1,217 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import config as cfg
+
+# =========================================
+#   HISTORIQUE ET DIFFUSION DES ALERTES
+# =========================================
+#
+# AlertStore : historique des alertes dans SQLite (index par source et par date)
+# au lieu d'une seule "dernière alerte" écrasée à chaque POST.
+# AlertBroadcaster : pousse chaque nouvelle alerte aux dashboards connectés
+# (Server-Sent Events) au lieu de les laisser interroger le serveur chaque seconde.
+
+COLUMNS = ("id", "source", "episode", "frame", "time", "detected_at", "received_at",
+           "count", "status", "acknowledged_at", "resolved_at", "clip")
+
+# Cycle de vie d'une alerte : nouvelle -> prise en charge -> résolue
+STATUSES = ("new", "acknowledged", "resolved")
+
+# Colonnes ajoutées depuis la première version de la base (migrées à l'ouverture)
+_MIGRATIONS = {
+    "episode": "TEXT",
+    "count": "INTEGER NOT NULL DEFAULT 1",
+    "status": "TEXT NOT NULL DEFAULT 'new'",
+    "acknowledged_at": "TEXT",
+    "resolved_at": "TEXT",
+    "clip": "TEXT",
+}
+
+
+def to_timestamp(value):
+    """Date ISO ou timestamp (s) -> timestamp ; None si absent."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def episode_key(data):
+    """
+    Identifiant de l'épisode de chute : champ "episode" (unique, posé par AlertDispatcher).
+    Anciennes alertes sans ce champ : frame de validation + heure de détection (l'index
+    de frame seul repart de 0 à chaque redémarrage / reconnexion). Sans heure : None,
+    l'alerte n'est jamais fusionnée.
+    """
+    episode = data.get("episode")
+    if episode is not None:
+        return str(episode)
+    if data.get("frame") is None or not data.get("detected_at"):
+        return None
+    return f"{data['frame']}@{data['detected_at']}"
+
+
+class AlertStore:
+    def __init__(self, path=cfg.ALERTS_DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Une connexion partagée par les threads de Flask, protégée par un verrou
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT,
+                    frame INTEGER,
+                    time REAL,
+                    detected_at TEXT,
+                    received_at TEXT,
+                    received_ts REAL NOT NULL
+                )""")
+            existing = {row["name"] for row in self.db.execute("PRAGMA table_info(alerts)")}
+            for name, decl in _MIGRATIONS.items():
+                if name not in existing:
+                    self.db.execute(f"ALTER TABLE alerts ADD COLUMN {name} {decl}")
+            self.db.execute("CREATE INDEX IF NOT EXISTS alerts_source_ts ON alerts (source, received_ts)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (received_ts)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS alerts_status ON alerts (status)")
+            # Une seule ligne par (source, épisode) : les répétitions ne font qu'incrémenter `count`
+            self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS alerts_episode ON alerts (source, episode)")
+
+    def add(self, data):
+        """Enregistre une alerte reçue ; retourne l'alerte créée, ou None si c'est un doublon."""
+        created, _ = self.add_many([data])
+        return created[0] if created else None
+
+    def add_many(self, events):
+        """
+        Enregistre un lot d'événements en une seule transaction.
+        Retourne (alertes créées, nb de doublons d'un épisode déjà connu).
+        """
+        now = time.time()
+        received_at = datetime.fromtimestamp(now).isoformat(timespec="seconds")
+        created, duplicates = [], 0
+        with self._lock, self.db:
+            for data in events:
+                alert = {
+                    "source": data.get("source"),
+                    "episode": episode_key(data),
+                    "frame": data.get("frame"),
+                    "time": data.get("time"),
+                    "detected_at": data.get("detected_at"),
+                    "received_at": received_at,
+                    "clip": data.get("clip"),
+                }
+                cur = self.db.execute(
+                    "INSERT OR IGNORE INTO alerts (source, episode, frame, time, detected_at, received_at, received_ts, clip) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (alert["source"], alert["episode"], alert["frame"], alert["time"],
+                     alert["detected_at"], received_at, now, alert["clip"]))
+                if cur.rowcount:
+                    alert.update(id=cur.lastrowid, count=1, status="new", acknowledged_at=None, resolved_at=None)
+                    created.append(alert)
+                else:
+                    self.db.execute("UPDATE alerts SET count = count + 1 WHERE source = ? AND episode = ?",
+                                    (alert["source"], alert["episode"]))
+                    duplicates += 1
+        return created, duplicates
+
+    def set_status(self, alert_id, status):
+        """
+        Passe une alerte à "acknowledged" ou "resolved".
+        Retourne l'alerte mise à jour, None si elle n'existe pas ; ValueError si la transition est invalide.
+        """
+        if status not in STATUSES[1:]:
+            raise ValueError(f"Statut invalide : {status}")
+        stamp = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self.db:
+            row = self.db.execute("SELECT status FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+            if row is None:
+                return None
+            if STATUSES.index(row["status"]) >= STATUSES.index(status):
+                raise ValueError(f"Alerte {alert_id} déjà {row['status']}")
+            self.db.execute(f"UPDATE alerts SET status = ?, {status}_at = ? WHERE id = ?", (status, stamp, alert_id))
+            row = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        return dict(row)
+
+    def get(self, alert_id):
+        with self._lock:
+            row = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        return dict(row) if row else None
+
+    def query(self, source=None, since=None, until=None, after_id=None, status=None, limit=100):
+        """Alertes les plus récentes d'abord, filtrées par source / période / id / statut."""
+        where, args = [], []
+        if source is not None: where.append("source = ?"); args.append(source)
+        if since is not None: where.append("received_ts >= ?"); args.append(since)
+        if until is not None: where.append("received_ts < ?"); args.append(until)
+        if after_id is not None: where.append("id > ?"); args.append(after_id)
+        if status is not None: where.append("status = ?"); args.append(status)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM alerts"
+        if where: sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            return [dict(row) for row in self.db.execute(sql, args)]
+
+    def last(self):
+        rows = self.query(limit=1)
+        return rows[0] if rows else None
+
+
+class AlertBroadcaster:
+    """
+    Abonnés = une file bornée par dashboard connecté, qui reçoit des (id, message SSE).
+    Un abonné trop lent est déconnecté (None dans sa file).
+    """
+
+    def __init__(self, queue_size=cfg.SSE_CLIENT_QUEUE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock: self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock: self._subscribers.discard(q)
+
+    def publish(self, alert, event="alert"):
+        # Sérialisé une fois pour tous les abonnés. Seules les nouvelles alertes portent
+        # un id SSE (Last-Event-ID) ; les changements de statut ne sont pas rejoués.
+        message = (alert["id"] if event == "alert" else None, format_sse(alert, event))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Le client ne suit pas : on le coupe, il se reconnectera avec Last-Event-ID
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                    q.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+def format_sse(alert, event="alert"):
+    if event == "alert":
+        return f"id: {alert['id']}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+    return f"event: {event}\ndata: {json.dumps(alert)}\n\n"
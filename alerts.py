@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import queue
+import threading
+import uuid
+from datetime import datetime
+import requests
+import config as cfg
+
+# =========================================
+#   ENVOI DES ALERTES (HORS BOUCLE D'ANALYSE)
+# =========================================
+#
+# Le thread de détection ne fait que déposer l'événement dans une file : le son
+# (préchargé au démarrage) et le POST vers le dashboard sont faits par un thread
+# dédié, avec une session HTTP persistante. Plusieurs alertes en attente partent
+# en un seul POST sur /api/alerts/batch.
+# Les alertes non délivrées vont dans une file de reprise sur disque (bornée,
+# les plus anciennes sont jetées) et sont renvoyées avec un délai croissant,
+# y compris après un redémarrage.
+
+_STOP = object()
+
+
+def load_sound(path):
+    """Charge (et décode) le son d'alerte une fois ; None si pygame / audio indisponible."""
+    try:
+        import pygame
+        pygame.mixer.init()
+        return pygame.mixer.Sound(path)
+    except Exception as e:
+        print(f"⚠️ Son d'alerte indisponible : {e}")
+        return None
+
+
+class AlertDispatcher:
+    def __init__(self, url=cfg.ALERT_API_URL, sound_path=cfg.ALERT_MP3_PATH,
+                 queue_path=cfg.ALERT_QUEUE_PATH, max_pending=cfg.ALERT_QUEUE_MAX, batch_url=cfg.ALERT_BATCH_URL):
+        self.url = url
+        self.batch_url = batch_url
+        self.queue_path = queue_path
+        self.max_pending = max_pending
+        self.sound = load_sound(sound_path) if sound_path else None
+
+        self.events = queue.Queue()
+        self.session = requests.Session()
+        self.pending = self._load_pending()   # Alertes en attente de renvoi (ordre d'arrivée)
+        self.retry_delay = cfg.ALERT_RETRY_MIN_DELAY
+        self.next_retry = time.monotonic()
+
+        self.sent = 0
+        self.failed = 0     # Envois en échec (chaque tentative compte)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._worker, name="alert-dispatch", daemon=True)
+        self.thread.start()
+
+    # -----------------------------------------
+    #   Côté détection (non bloquant)
+    # -----------------------------------------
+
+    def dispatch(self, frame_idx, source, time_sec=None, clip=None):
+        """Dépose une alerte ; retourne immédiatement. `clip` : chemin du clip avant / après (clips.py)."""
+        self.events.put_nowait({
+            "episode": uuid.uuid4().hex,  # Un renvoi par la file de reprise garde le même
+            "frame": frame_idx,
+            "time": time_sec,
+            "source": source,
+            "detected_at": datetime.now().isoformat(timespec="milliseconds"),
+            "clip": clip,
+        })
+
+    def close(self, timeout=2.0):
+        """Arrête le worker après les alertes déjà déposées (les échecs restent sur disque)."""
+        self.events.put_nowait(_STOP)
+        self.thread.join(timeout)
+
+    # -----------------------------------------
+    #   Worker
+    # -----------------------------------------
+
+    def _worker(self):
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, self.next_retry - time.monotonic()) if self.pending else None
+            try:
+                batch = [self.events.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            # Alertes arrivées en même temps (plusieurs flux) : envoyées en un seul lot
+            while len(batch) < cfg.ALERT_BATCH_MAX:
+                try: batch.append(self.events.get_nowait())
+                except queue.Empty: break
+            if _STOP in batch:
+                stopping = True
+                batch = [e for e in batch if e is not _STOP]
+
+            if batch:
+                if self.sound is not None: self.sound.play()
+                # Pas de doublement si des alertes plus anciennes attendent : on garde l'ordre
+                if self.pending or not self._send(batch):
+                    self._add_pending(batch)
+            if self.pending and time.monotonic() >= self.next_retry:
+                self._retry_pending()
+
+        self.session.close()
+
+    def _send(self, events):
+        """Un événement : POST simple ; plusieurs : un seul POST sur la route groupée."""
+        url, body = (self.url, events[0]) if len(events) == 1 else (self.batch_url, {"events": events})
+        try:
+            r = self.session.post(url, json=body, timeout=cfg.ALERT_TIMEOUT)
+        except requests.RequestException:
+            r = None
+        # Un renvoi déjà reçu est dédoublonné par le serveur (source, épisode)
+        if r is None or r.status_code >= 500:
+            self.failed += 1
+            return False
+        if 200 <= r.status_code < 300:
+            self.sent += len(events)
+            return True
+        if len(events) > 1 and r.status_code in (404, 405, 413):
+            # Route groupée absente (ancien app.py) ou lot trop gros : deux moitiés,
+            # jusqu'aux POST simples si besoin
+            half = len(events) // 2
+            return self._send(events[:half]) and self._send(events[half:])
+        # Autre 4xx : le serveur refuse l'alerte, la renvoyer ne changera rien
+        print(f"❌ Dashboard : HTTP {r.status_code} sur {url}, {len(events)} alerte(s) perdue(s)")
+        self.dropped += len(events)
+        return True
+
+    def _retry_pending(self):
+        while self.pending:
+            chunk = self.pending[:cfg.ALERT_BATCH_MAX]
+            if not self._send(chunk):
+                self.next_retry = time.monotonic() + self.retry_delay
+                self.retry_delay = min(self.retry_delay * 2, cfg.ALERT_RETRY_MAX_DELAY)
+                break
+            del self.pending[:len(chunk)]
+        else:
+            self.retry_delay = cfg.ALERT_RETRY_MIN_DELAY
+            print("✅ Alertes en attente délivrées")
+        self._save_pending()
+
+    # -----------------------------------------
+    #   File de reprise sur disque
+    # -----------------------------------------
+
+    def _add_pending(self, events):
+        if not self.pending:
+            print(f"⚠️ Dashboard injoignable ({self.url}), alerte(s) mise(s) en file de reprise")
+            self.next_retry = time.monotonic() + self.retry_delay
+        self.pending.extend(events)
+        if len(self.pending) > self.max_pending:
+            self.dropped += len(self.pending) - self.max_pending
+            del self.pending[:-self.max_pending]
+        self._save_pending()
+
+    def _load_pending(self):
+        try:
+            with open(self.queue_path) as f:
+                return [json.loads(line) for line in f if line.strip()][-self.max_pending:]
+        except (OSError, ValueError):
+            return []
+
+    def _save_pending(self):
+        if not self.pending:
+            if os.path.exists(self.queue_path): os.remove(self.queue_path)
+            return
+        os.makedirs(os.path.dirname(self.queue_path), exist_ok=True)
+        tmp = f"{self.queue_path}.tmp"
+        with open(tmp, "w") as f:
+            for event in self.pending: f.write(json.dumps(event) + "\n")
+        os.replace(tmp, self.queue_path)
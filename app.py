@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify, render_template
-from datetime import datetime
+import os
+import queue
+from flask import Flask, Response, request, jsonify, render_template, send_file
+import config as cfg
+from alert_store import AlertStore, AlertBroadcaster, format_sse, to_timestamp
 
 app = Flask(__name__)
 
-last_alert = None
+store = AlertStore()
+broadcaster = AlertBroadcaster()
 
 
 @app.route("/")
@@ -15,29 +19,91 @@ def index():
 @app.route("/api/alert", methods=["POST"])
 def api_alert():
     """
-    Reçoit une alerte depuis main.py :
+    Reçoit une alerte depuis main.py / server.py :
     {
         "frame": ...,
         "time": ...,
-        "source": "videos\\chute_1.mp4"
+        "source": "videos\\chute_1.mp4",
+        "detected_at": "...",
+        "episode": "..." (identifiant unique de la chute, dédoublonnage des renvois),
+        "clip": "output/clips/..." (optionnel)
     }
+    L'alerte est ajoutée à l'historique puis poussée aux dashboards connectés.
     """
-    global last_alert
-    data = request.get_json()
+    data = request.get_json(silent=True)
 
-    print("🆕 Nouvelle alerte reçue :", data)
+    if not data or not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    alert = store.add(data)
+    if alert is None:
+        # Même (source, épisode) déjà enregistré : renvoi ou répétition
+        return jsonify({"status": "duplicate"}), 200
+
+    print("🆕 Nouvelle alerte reçue :", alert)
+    broadcaster.publish(alert)
+
+    return jsonify({"status": "alert_saved", "id": alert["id"]}), 201
+
+
+@app.route("/api/alerts/batch", methods=["POST"])
+def api_alerts_batch():
+    """
+    Reçoit plusieurs alertes en une requête : {"events": [{...}, ...]} ou directement la liste.
+    Tout le lot est écrit en une transaction ; les doublons d'un même (source, épisode)
+    ne créent pas de nouvelle alerte.
+    """
+    data = request.get_json(silent=True)
+    events = data.get("events") if isinstance(data, dict) else data
 
-    if not data:
+    if not isinstance(events, list) or not all(isinstance(e, dict) for e in events):
         return jsonify({"error": "Invalid JSON"}), 400
+    if len(events) > cfg.ALERT_BATCH_MAX:
+        return jsonify({"error": f"Too many events (max {cfg.ALERT_BATCH_MAX})"}), 413
 
-    last_alert = {
-        "frame": data.get("frame"),
-        "time": data.get("time"),
-        "source": data.get("source"),
-        "received_at": datetime.now().isoformat(timespec="seconds"),
-    }
+    created, duplicates = store.add_many(events)
+    if created:
+        print(f"🆕 {len(created)} nouvelle(s) alerte(s) reçue(s) en lot")
+    for alert in created:
+        broadcaster.publish(alert)
+
+    return jsonify({
+        "received": len(events),
+        "created": len(created),
+        "duplicates": duplicates,
+        "ids": [alert["id"] for alert in created],
+    }), 201 if created else 200
+
+
+@app.route("/api/alerts/<int:alert_id>/<action>", methods=["POST"])
+def api_alert_status(alert_id, action):
+    """Prise en charge (ack) ou résolution (resolve) d'une alerte, diffusée aux dashboards."""
+    status = {"ack": "acknowledged", "resolve": "resolved"}.get(action)
+    if status is None:
+        return jsonify({"error": "Unknown action"}), 404
+
+    try:
+        alert = store.set_status(alert_id, status)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    if alert is None:
+        return jsonify({"error": "Alert not found"}), 404
+
+    broadcaster.publish(alert, event="status")
+    return jsonify({"alert": alert}), 200
 
-    return jsonify({"status": "alert_saved"}), 201
+
+@app.route("/api/alerts/<int:alert_id>/clip", methods=["GET"])
+def api_alert_clip(alert_id):
+    """Clip avant / après chute d'une alerte, s'il a été écrit dans CLIPS_DIR sur ce poste."""
+    alert = store.get(alert_id)
+    if alert is None or not alert["clip"]:
+        return jsonify({"error": "No clip"}), 404
+    path = os.path.realpath(alert["clip"])
+    # Seuls les fichiers de CLIPS_DIR sont servis (le chemin vient du payload de l'alerte)
+    if os.path.dirname(path) != os.path.realpath(cfg.CLIPS_DIR) or not os.path.exists(path):
+        return jsonify({"error": "Clip not available"}), 404
+    return send_file(path, as_attachment=True)
 
 
 @app.route("/api/last-alert", methods=["GET"])
@@ -49,10 +115,67 @@ def api_last_alert():
       "hasAlert": true/false
     }
     """
+    last_alert = store.last()
     if last_alert is None:
         return jsonify({"alert": None, "hasAlert": False}), 200
     return jsonify({"alert": last_alert, "hasAlert": True}), 200
 
 
+@app.route("/api/alerts", methods=["GET"])
+def api_alerts():
+    """
+    Historique, plus récentes d'abord.
+    Paramètres : source, status, since / until (ISO ou timestamp), limit (défaut 100, max 1000).
+    """
+    try:
+        since = to_timestamp(request.args.get("since"))
+        until = to_timestamp(request.args.get("until"))
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid parameters"}), 400
+
+    alerts = store.query(source=request.args.get("source"), status=request.args.get("status"),
+                         since=since, until=until, limit=limit)
+    return jsonify({"alerts": alerts, "count": len(alerts)}), 200
+
+
+@app.route("/api/alerts/stream", methods=["GET"])
+def api_alerts_stream():
+    """
+    Server-Sent Events : chaque nouvelle alerte (événement "alert") et chaque
+    changement de statut (événement "status") est poussé dès sa réception.
+    Avec l'en-tête Last-Event-ID (reconnexion automatique du navigateur),
+    les alertes manquées entre-temps sont renvoyées d'abord.
+    """
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    q = broadcaster.subscribe()
+    # Abonné avant la lecture de l'historique : aucune alerte ne peut passer entre les deux
+    missed = store.query(after_id=last_id, limit=1000)[::-1] if last_id is not None else []
+
+    # Toute alerte d'id <= replayed_id était déjà en base lors de la lecture de l'historique
+    replayed_id = missed[-1]["id"] if missed else (last_id or 0)
+
+    def stream():
+        try:
+            yield "retry: 2000\n\n"
+            for alert in missed:
+                yield format_sse(alert)
+            while True:
+                try:
+                    message = q.get(timeout=cfg.SSE_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None: break  # Client trop lent, déconnecté
+                alert_id, text = message
+                if alert_id is not None and alert_id <= replayed_id: continue  # Déjà envoyée avec l'historique
+                yield text
+        finally:
+            broadcaster.unsubscribe(q)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream(), mimetype="text/event-stream", headers=headers)
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,59 @@
+import os
+import time
+import argparse
+from sources import open_source, BACKENDS
+
+# =========================================
+#   ANALYSE BATCH HORS-LIGNE
+# =========================================
+#
+# Pour ré-analyser des nuits archivées, avec le moteur en flux lui-même
+# (FallDetector.process) : les résultats sont ceux du flux par construction.
+# Le débit vient de la source (décodage d'avance dans un thread, backend au
+# choix) et de la veille, qui évite l'analyse complète des longues périodes
+# immobiles. Un analyseur par paquets de frames (NumPy) n'était pas plus rapide :
+# flou/CLAHE, ouverture et blobs restent par frame, et les appels OpenCV par
+# frame sont déjà vectorisés.
+
+def analyze_file(path, scale=None, backend=None):
+    """Analyse d'un fichier ; retourne (src, detector, générateur de FrameResult)."""
+    src, detector = open_source(path, backend, scale=scale)
+
+    def results():
+        try:
+            for frame_idx, frame in src.read():
+                yield detector.process(frame, frame_idx)
+        finally:
+            src.release()
+    return src, detector, results()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse batch hors-ligne de vidéos archivées")
+    parser.add_argument("videos", nargs="+", help="Fichiers vidéo à analyser")
+    parser.add_argument("--scale", type=float, default=None, help="Echelle d'analyse")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="Décodeur vidéo (défaut : cfg.DECODE_BACKEND)")
+    args = parser.parse_args()
+
+    for path in args.videos:
+        if not os.path.exists(path):
+            print(f"⚠️  {path} : INTROUVABLE")
+            continue
+
+        t0 = time.perf_counter()
+        src, detector, results = analyze_file(path, args.scale, args.backend)
+        n_frames = n_idle = last_idx = 0
+        for res in results:
+            n_frames += 1
+            n_idle += res.idle
+            last_idx = res.frame_idx
+        elapsed = time.perf_counter() - t0
+        # Durée couverte par la vidéo (index source / fps source)
+        duration = (last_idx + 1) / src.fps if n_frames else 0.0
+
+        name = os.path.basename(path)
+        status = f"CHUTE (frame {detector.fall_frame})" if detector.fall_detected else "RIEN"
+        print(f"{name.ljust(35)} : {status}")
+        print(f"   {n_frames / elapsed:7.1f} frames/s, x{duration / elapsed:.1f} temps réel "
+              f"({duration / 3600:.2f} h de vidéo en {elapsed:.1f} s, {n_idle / max(n_frames, 1):.0%} en veille)")
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import argparse
+import contextlib
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+import cv2
+import numpy as np
+import config as cfg
+import detector as detector_module
+from sources import open_source
+
+# =========================================
+#   BENCHMARK DU PIPELINE DE DETECTION
+# =========================================
+#
+# Sur les vidéos de TEST_CASES (ou des clips synthétiques encodés à la volée si
+# elles sont absentes), mesure :
+#   - frames/s et latence par frame (p50 / p99), décodage compris ou non
+#   - le temps de chaque étape du pipeline
+#   - le pic d'allocation transitoire par frame (tracemalloc) et le pic de RSS
+# et enregistre le tout en JSON pour comparer deux commits.
+#
+#   python benchmark.py                          -> vidéos de TEST_CASES, sinon synthétiques
+#   python benchmark.py videos/xxx.MOV           -> vidéo(s) donnée(s)
+#   python benchmark.py --compare ancien.json    -> écarts par rapport à un run précédent
+
+STAGES = ("decode", "grayscale", "brightness", "blur_clahe", "diff_morphology",
+          "blobs", "orientation", "decision")
+
+
+def synthetic_frames(n_frames, width=1920, height=1080, night=False, seed=0):
+    """Génère un clip (paysage) avec un rectangle qui bouge, frame par frame."""
+    rng = np.random.default_rng(seed)
+    low, high = (5, 15) if night else (90, 160)
+    background = rng.integers(low, high, (height, width, 3), dtype=np.uint8)
+    color = (60, 60, 60) if night else (240, 240, 240)
+    for i in range(n_frames):
+        frame = background.copy()
+        x = int(width * 0.3 + (width * 0.4) * (i % 90) / 90)
+        cv2.rectangle(frame, (x, height // 3), (x + width // 10, height // 3 + height // 4), color, -1)
+        yield i, frame
+
+def write_synthetic_clip(path, n_frames, night=False, fps=30):
+    """Encode un clip synthétique : le décodage est ainsi mesuré comme pour une vraie vidéo."""
+    writer = None
+    for _, frame in synthetic_frames(n_frames, night=night):
+        if writer is None:
+            h, w = frame.shape[:2]
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+        writer.write(frame)
+    writer.release()
+    return path
+
+def benchmark_sources(videos, n_frames):
+    """Vidéos demandées, sinon celles de TEST_CASES présentes, sinon deux clips synthétiques."""
+    if videos:
+        return videos
+    found = [os.path.join(cfg.VIDEOS_DIR, f) for f in cfg.TEST_CASES
+             if os.path.exists(os.path.join(cfg.VIDEOS_DIR, f))]
+    if found:
+        return found
+    print("⚠️  Aucune vidéo de TEST_CASES : clips synthétiques 1080p (jour + nuit)")
+    tmp = tempfile.mkdtemp(prefix="fallcall-bench-")
+    return [write_synthetic_clip(os.path.join(tmp, "synthetic_day.mp4"), n_frames),
+            write_synthetic_clip(os.path.join(tmp, "synthetic_night.mp4"), n_frames, night=True)]
+
+
+class StageTimer:
+    """
+    Chronomètre les étapes du vrai FallDetector.process() en enveloppant ses méthodes
+    (et les fonctions du module qu'il appelle) : aucune copie du pipeline à maintenir.
+    Temps exclusifs : une étape appelée dans une autre (measure dans apply_motion)
+    n'est comptée qu'une fois. Le reste de process() (différence, seuil, ouverture,
+    échange des buffers) est la part "diff_morphology".
+    """
+
+    # Méthodes du détecteur / fonctions du module detector -> étape
+    METHODS = {"to_gray": "grayscale", "next_mode": "brightness", "find_body": "blobs",
+               "measure": "orientation", "apply_motion": "decision", "update_state": "decision",
+               "update_idle": "decision", "end_frame": "decision"}
+    FUNCTIONS = {"estimate_brightness": "brightness", "apply_light_condition": "blur_clahe"}
+
+    def __init__(self):
+        self.time = dict.fromkeys(STAGES, 0.0)
+        self._inner = []  # Temps des étapes imbriquées, par niveau d'appel
+
+    def wrap(self, stage, fn):
+        clock = time.perf_counter
+        def timed(*args, **kwargs):
+            self._inner.append(0.0)
+            t0 = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = clock() - t0
+                self.time[stage] += elapsed - self._inner.pop()
+                if self._inner: self._inner[-1] += elapsed
+        return timed
+
+    def attach(self, detector):
+        for name, stage in self.METHODS.items():
+            setattr(detector, name, self.wrap(stage, getattr(detector, name)))
+        return detector
+
+    @contextlib.contextmanager
+    def module_functions(self):
+        """Chronomètre aussi les fonctions du module detector, le temps du bloc seulement."""
+        originals = {name: getattr(detector_module, name) for name in self.FUNCTIONS}
+        for name, stage in self.FUNCTIONS.items():
+            setattr(detector_module, name, self.wrap(stage, originals[name]))
+        try:
+            yield self
+        finally:
+            for name, fn in originals.items(): setattr(detector_module, name, fn)
+
+
+def timed_frames(path, limit, scale=None):
+    """
+    (index, frame, temps de décodage) depuis la source configurée (cfg.DECODE_BACKEND),
+    sans prefetch pour mesurer le décodage ; retourne aussi le détecteur de open_source,
+    veille désactivée (on mesure le pipeline complet).
+    """
+    src, detector = open_source(path, scale=scale, prefetch=0)
+    detector.idle_after = 0
+    def frames():
+        it = src.read()
+        for n in range(limit):
+            t0 = time.perf_counter()
+            item = next(it, None)
+            if item is None: break
+            yield item[0], item[1], time.perf_counter() - t0
+        src.release()
+    return frames(), detector
+
+def result_key(res):
+    return (res.frame_idx, res.is_night, res.area, res.y_raw, res.bbox, res.dy, res.fall_counter, res.fall_detected)
+
+def bench_video(path, n_frames, scale=None, track_alloc=True):
+    # Passe 1 : détecteur de production, latences par frame (décodage à part)
+    frames, detector = timed_frames(path, n_frames, scale)
+    decode, process, keys = [], [], []
+    for idx, frame, t_decode in frames:
+        t0 = time.perf_counter()
+        res = detector.process(frame, idx)
+        process.append(time.perf_counter() - t0)
+        decode.append(t_decode)
+        keys.append(result_key(res))
+
+    # Passe 2 : temps par étape (même process(), étapes chronométrées), mêmes résultats attendus
+    frames, staged = timed_frames(path, n_frames, scale)
+    timer = StageTimer()
+    timer.attach(staged)
+    staged_keys, staged_total = [], 0.0
+    with timer.module_functions():
+        for idx, frame, _ in frames:
+            t0 = time.perf_counter()
+            staged_keys.append(result_key(staged.process(frame, idx)))
+            staged_total += time.perf_counter() - t0
+    stages = dict(timer.time, decode=sum(decode))
+    stages["diff_morphology"] = max(0.0, staged_total - sum(timer.time.values()))
+
+    # Passe 3 : allocations transitoires par frame (la 1ère frame alloue les buffers)
+    peaks = []
+    if track_alloc:
+        frames, detector = timed_frames(path, n_frames, scale)
+        tracemalloc.start()
+        for idx, frame, _ in frames:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            detector.process(frame, idx)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+        peaks = peaks[2:] or peaks
+
+    n = len(process)
+    process_ms = np.array(process) * 1000
+    total_ms = process_ms + np.array(decode) * 1000
+    return {
+        "video": os.path.basename(path),
+        "frames": n,
+        "fps_process": n / max(sum(process), 1e-9),
+        "fps_total": n / max(sum(process) + sum(decode), 1e-9),
+        "latency_ms": {
+            "process_p50": float(np.percentile(process_ms, 50)) if n else 0.0,
+            "process_p99": float(np.percentile(process_ms, 99)) if n else 0.0,
+            "total_p50": float(np.percentile(total_ms, 50)) if n else 0.0,
+            "total_p99": float(np.percentile(total_ms, 99)) if n else 0.0,
+        },
+        "stages_ms": {name: stages[name] / max(n, 1) * 1000 for name in STAGES},
+        "alloc_peak_kb": float(np.mean(peaks) / 1024) if peaks else None,
+        "staged_matches": staged_keys == keys,
+    }
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du process (None si indisponible)."""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 ** 2 if os.uname().sysname == "Darwin" else rss / 1024  # octets sur macOS, Ko ailleurs
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    except (ImportError, AttributeError):
+        return None
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cfg.BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def summarize(videos):
+    """Moyennes pondérées par le nombre de frames."""
+    n = sum(v["frames"] for v in videos) or 1
+    return {
+        "frames": n,
+        "fps_process": n / sum(v["frames"] / v["fps_process"] for v in videos if v["frames"]),
+        "fps_total": n / sum(v["frames"] / v["fps_total"] for v in videos if v["frames"]),
+        "stages_ms": {s: sum(v["stages_ms"][s] * v["frames"] for v in videos) / n for s in STAGES},
+    }
+
+def print_report(report, previous=None):
+    s = report["summary"]
+    prev = previous["summary"] if previous else None
+
+    def delta(new, old):
+        if old in (None, 0): return ""
+        return f"  ({(new - old) / old * 100:+.0f}%)"
+
+    print(f"--- BENCHMARK ({report['commit'] or '?'}, échelle {report['scale']}) ---")
+    for v in report["videos"]:
+        lat = v["latency_ms"]
+        alloc = f"{v['alloc_peak_kb']:.0f} Ko" if v["alloc_peak_kb"] is not None else "-"
+        check = "" if v["staged_matches"] else "  ⚠️ mesure par étape divergente"
+        print(f"{v['video'][:30].ljust(30)} {v['frames']:5d} fr  {v['fps_total']:6.1f} fps  "
+              f"p50 {lat['total_p50']:6.2f} ms  p99 {lat['total_p99']:6.2f} ms  alloc {alloc}{check}")
+    print("-" * 60)
+    print(f"Frames/s (analyse)     : {s['fps_process']:.1f}{delta(s['fps_process'], prev and prev['fps_process'])}")
+    print(f"Frames/s (+ décodage)  : {s['fps_total']:.1f}{delta(s['fps_total'], prev and prev['fps_total'])}")
+    print(f"Pic RSS                : {report['peak_rss_mb']:.0f} Mo" if report["peak_rss_mb"] else "Pic RSS : -")
+    print("ms/frame par étape :")
+    total = sum(s["stages_ms"].values()) or 1
+    for name in STAGES:
+        ms = s["stages_ms"][name]
+        old = prev["stages_ms"].get(name) if prev else None
+        print(f"   {name.ljust(18)} {ms:7.3f}  {ms / total * 100:5.1f}%{delta(ms, old)}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline de détection (par étape)")
+    parser.add_argument("videos", nargs="*", help="Vidéos (défaut : TEST_CASES, sinon clips synthétiques)")
+    parser.add_argument("--frames", type=int, default=300, help="Frames analysées par vidéo")
+    parser.add_argument("--scale", type=float, default=None, help="Echelle d'analyse")
+    parser.add_argument("--no-alloc", action="store_true", help="Sans la passe tracemalloc (plus rapide)")
+    parser.add_argument("--json", default=None, help="Fichier de résultats (défaut : output/bench/bench-<commit>.json)")
+    parser.add_argument("--compare", metavar="JSON", default=None, help="Résultats précédents à comparer")
+    args = parser.parse_args()
+
+    videos = [bench_video(p, args.frames, args.scale, not args.no_alloc)
+              for p in benchmark_sources(args.videos, args.frames)]
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "scale": args.scale or cfg.ANALYSIS_SCALE,
+        "videos": videos,
+        "summary": summarize(videos),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f: previous = json.load(f)
+    print_report(report, previous)
+
+    json_path = args.json or os.path.join(cfg.OUTPUT_DIR, "bench", f"bench-{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+    with open(json_path, "w") as f: json.dump(report, f, indent=2)
+    print(f"Résultats : {json_path}")
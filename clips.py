@@ -0,0 +1,204 @@
+import os
+import time
+import queue
+import threading
+import concurrent.futures
+from collections import deque
+from datetime import datetime
+import cv2
+import config as cfg
+from detector import downscale
+from telemetry import Histogram
+
+# =========================================
+#   CLIPS AVANT / APRES CHUTE
+# =========================================
+#
+# Chaque flux garde ses dernières secondes en mémoire, compressées : paquets
+# encodés tels que démultiplexés (source PyAV, clip écrit sans ré-encodage), sinon
+# frames JPEG réduites (CLIP_SCALE, CLIP_FPS). Mémoire bornée par CLIP_BUFFER_MAX_MB
+# et CLIP_PRE_SEC + CLIP_POST_SEC.
+# Sur alerte, trigger() retourne tout de suite le chemin du clip ; il est écrit par
+# un thread dédié CLIP_POST_SEC plus tard, une fois les secondes d'après reçues.
+# Le thread d'analyse ne fait que déposer les frames dans une file bornée.
+
+_STOP = object()
+
+
+class ClipRecorder:
+    def __init__(self, name, fps, out_dir=cfg.CLIPS_DIR, pre_sec=cfg.CLIP_PRE_SEC, post_sec=cfg.CLIP_POST_SEC,
+                 max_bytes=cfg.CLIP_BUFFER_MAX_MB * 1024 * 1024, template=None, write_hist=None):
+        """
+        `fps` : fps de la source ; `template` : flux PyAV dont on garde les paquets (None = frames JPEG).
+        `write_hist` : histogramme des écritures (SharedHistogram en mode multi-process).
+        """
+        self.name = name
+        self.fps = fps
+        self.out_dir = out_dir
+        self.pre, self.post = pre_sec, post_sec
+        self.max_bytes = max_bytes
+        self.template = template
+        self.ext = ".mkv" if template is not None else ".avi"
+
+        # Entrées (temps s, taille, image clé, données), la plus ancienne à gauche
+        self.ring = deque()
+        self.bytes = 0
+        self.pending = []          # Clips demandés : (début, fin, chemin)
+        self._last_kept = None     # Temps de la dernière frame gardée (CLIP_FPS)
+        self._t0 = None            # Premier timestamp des paquets
+
+        self.written = 0
+        self.dropped = 0           # Frames perdues (file pleine, case du bus réécrite)
+        self.write_hist = write_hist or Histogram()  # Ecriture d'un clip, une fois ses dernières secondes reçues
+
+        self.items = queue.Queue(maxsize=cfg.CLIP_QUEUE_SIZE)
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-clip-write")
+        self.thread = threading.Thread(target=self._worker, name=f"{name}-clip", daemon=True)
+        self.thread.start()
+
+    def attach(self, src):
+        """Branche le recorder sur une source PyAV (paquets) ; sans effet sinon."""
+        if self.template is not None:
+            src.on_packet = self.add_packet
+
+    # -----------------------------------------
+    #   Côté flux (non bloquant)
+    # -----------------------------------------
+
+    def add_frame(self, frame_idx, frame, valid=None):
+        """
+        Frame décodée (ignorée si le recorder garde les paquets). `valid` : pour une vue
+        du bus de frames (framebus.py), dit après compression si la case est restée intacte.
+        """
+        if self.template is not None: return
+        try:
+            self.items.put_nowait(("frame", frame_idx / self.fps, frame, valid))
+        except queue.Full:
+            self.dropped += 1
+
+    def add_packet(self, packet):
+        if packet.size == 0 or packet.pts is None: return  # Paquet de fin de flux
+        try:
+            self.items.put_nowait(("packet", packet))
+        except queue.Full:
+            self.dropped += 1
+
+    def trigger(self, frame_idx):
+        """Demande le clip autour de `frame_idx` ; retourne son chemin (écrit CLIP_POST_SEC plus tard)."""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.out_dir, f"{self.name}-{stamp}-f{frame_idx}{self.ext}")
+        self.items.put(("trigger", frame_idx / self.fps, path))  # Rare : peut attendre une place
+        return path
+
+    def close(self, timeout=10.0):
+        """Ecrit les clips en cours avec ce qui a été reçu, puis arrête les threads."""
+        self.items.put(_STOP)
+        self.thread.join(timeout)
+        self.writer.shutdown(wait=True)
+
+    # -----------------------------------------
+    #   Thread de mise en mémoire
+    # -----------------------------------------
+
+    def _worker(self):
+        while True:
+            item = self.items.get()
+            if item is _STOP: break
+            kind = item[0]
+            if kind == "trigger":
+                _, t, path = item
+                self.pending.append((t - self.pre, t + self.post, path))
+                continue
+            t = self._add_frame(*item[1:]) if kind == "frame" else self._add_packet(item[1])
+            if t is not None: self._flush(t)
+        self._flush(float("inf"))
+
+    def _add_frame(self, t, frame, valid):
+        if self._last_kept is not None and t - self._last_kept < 1.0 / cfg.CLIP_FPS - 1e-6:
+            return None
+        self._last_kept = t
+        if cfg.CLIP_SCALE < 1.0: frame = downscale(frame, cfg.CLIP_SCALE)
+        ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, cfg.CLIP_JPEG_QUALITY])
+        if not ok: return None
+        if valid is not None and not valid():  # Case du bus réécrite pendant la compression
+            self.dropped += 1
+            return None
+        self._append((t, data.nbytes, True, data))
+        return t
+
+    def _add_packet(self, packet):
+        if self._t0 is None: self._t0 = packet.pts
+        t = float((packet.pts - self._t0) * packet.time_base)
+        self._append((t, packet.size, packet.is_keyframe, packet))
+        return t
+
+    def _append(self, entry):
+        self.ring.append(entry)
+        self.bytes += entry[1]
+        horizon = self.pre + self.post
+        while self.ring and (self.bytes > self.max_bytes or entry[0] - self.ring[0][0] > horizon):
+            self.bytes -= self.ring.popleft()[1]
+
+    def _flush(self, now):
+        """Envoie à l'écriture les clips dont toutes les secondes d'après sont reçues."""
+        ready = [p for p in self.pending if p[1] <= now]
+        if not ready: return
+        self.pending = [p for p in self.pending if p[1] > now]
+        for start, end, path in ready:
+            entries = [e for e in self.ring if start <= e[0] <= end]
+            if entries: self.writer.submit(self._write, path, entries)
+
+    # -----------------------------------------
+    #   Ecriture
+    # -----------------------------------------
+
+    def _write(self, path, entries):
+        t0 = time.perf_counter()
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if self.template is not None:
+                self._write_packets(path, entries)
+            else:
+                self._write_frames(path, entries)
+        except Exception as e:
+            print(f"⚠️ [{self.name}] Clip non écrit ({path}) : {e}")
+            return
+        self.write_hist.observe(time.perf_counter() - t0)
+        self.written += 1
+        print(f"🎞️ [{self.name}] Clip écrit : {path}")
+
+    def _write_frames(self, path, entries):
+        first = cv2.imdecode(entries[0][3], cv2.IMREAD_UNCHANGED)
+        height, width = first.shape[:2]
+        # Cadence réelle des frames gardées (CLIP_FPS arrondi sur les frames de la source)
+        span = entries[-1][0] - entries[0][0]
+        fps = (len(entries) - 1) / span if span > 0 else min(cfg.CLIP_FPS, self.fps)
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height), first.ndim == 3)
+        try:
+            for _, _, _, data in entries:
+                frame = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+                if frame.shape[:2] == (height, width): out.write(frame)  # Reconnexion en autre résolution
+        finally:
+            out.release()
+
+    def _write_packets(self, path, entries):
+        import av
+        # Le clip doit commencer par une image clé
+        while entries and not entries[0][2]: entries = entries[1:]
+        if not entries: raise ValueError("aucune image clé dans le tampon")
+        with av.open(path, "w") as out:
+            if hasattr(out, "add_stream_from_template"):
+                stream = out.add_stream_from_template(self.template)
+            else:
+                stream = out.add_stream(template=self.template)
+            for _, _, _, packet in entries:
+                packet.stream = stream
+                out.mux(packet)
+
+
+def open_recorder(name, src):
+    """ClipRecorder adapté à la source : paquets tels quels avec PyAV, frames JPEG sinon."""
+    template = getattr(src, "stream", None) if hasattr(src, "on_packet") else None
+    recorder = ClipRecorder(name, src.fps, template=template)
+    recorder.attach(src)
+    return recorder
@@ -9,21 +9,117 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 VIDEOS_DIR = os.path.join(BASE_DIR, "videos")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 STATS_DIR = os.path.join(OUTPUT_DIR, "stats")
+TRACES_DIR = os.path.join(OUTPUT_DIR, "traces")
+METRICS_DIR = os.path.join(OUTPUT_DIR, "metrics")
+CLIPS_DIR = os.path.join(OUTPUT_DIR, "clips")
 ALERT_API_URL = "http://127.0.0.1:5000/api/alert"
+ALERT_BATCH_URL = "http://127.0.0.1:5000/api/alerts/batch"
 ALERT_MP3_PATH = os.path.join(BASE_DIR, "static", "alert.mp3")
 
+# Envoi des alertes (alerts.py)
+ALERT_TIMEOUT = 1.0               # Timeout d'un POST vers le dashboard (s)
+ALERT_QUEUE_PATH = os.path.join(OUTPUT_DIR, "alert_queue.jsonl")  # Alertes non délivrées
+ALERT_QUEUE_MAX = 1000            # Au-delà, les plus anciennes sont jetées
+ALERT_RETRY_MIN_DELAY = 1.0       # Délai avant le 1er renvoi, doublé à chaque échec...
+ALERT_RETRY_MAX_DELAY = 60.0      # ...jusqu'à ce maximum
+ALERT_BATCH_MAX = 500             # Evénements max par envoi groupé (/api/alerts/batch)
+
+# Clips avant / après chute (clips.py), joints aux alertes
+CLIP_PRE_SEC = 5.0                # Secondes gardées avant la chute...
+CLIP_POST_SEC = 5.0               # ...et écrites après
+CLIP_BUFFER_MAX_MB = 32           # Mémoire max du tampon compressé, par caméra
+CLIP_FPS = 15                     # Frames JPEG gardées par seconde (sources non PyAV)...
+CLIP_SCALE = 0.5                  # ...réduites à cette échelle...
+CLIP_JPEG_QUALITY = 80            # ...et cette qualité
+CLIP_QUEUE_SIZE = 4               # Frames en attente de compression (au-delà, jetées)
+
+# Dashboard (app.py)
+ALERTS_DB_PATH = os.path.join(OUTPUT_DIR, "alerts.db")  # Historique des alertes (SQLite)
+SSE_HEARTBEAT = 15.0              # Commentaire keep-alive envoyé aux dashboards (s)
+SSE_CLIENT_QUEUE = 256            # Alertes en attente max par dashboard avant déconnexion
+
 # Paramètres Généraux
-ROTATE_VIDEO = True
+# Orientation caméra : rotation qui remet l'image "debout" (y vers le sol).
+# "0", "90_CW", "90_CCW" ou "180". L'analyse travaille sur l'image native et ne fait
+# que convertir centroïde / boite ; la rotation n'est appliquée qu'à l'affichage.
+ORIENTATION = "90_CW"
+# Zone du lit (optionnelle) : polygone en fractions (0-1) de l'image NATIVE (non tournée).
+# Seul le rectangle englobant est analysé, et le mouvement hors polygone est ignoré.
+# ex : BED_ROI = [(0.1, 0.2), (0.9, 0.2), (0.9, 0.8), (0.1, 0.8)]
+BED_ROI = None
 WINDOW_SCALE = 0.4
 DEBUG = True
 DISPLAY_VIDEO = True
+PREVIEW_FPS = 10            # Rafraîchissement max de la fenêtre (main.py), indépendant de l'analyse
+
+# Décodage (sources.py)
+DECODE_BACKEND = "opencv"   # "opencv", "ffmpeg" (pipe -vf scale,format=gray) ou "pyav"
+DECODE_PREFETCH = 4         # Frames décodées d'avance par un thread de lecture (0 = dans le thread d'analyse)
+
+# Serveur multi-caméras (server.py)
+# Chaque source : chemin de fichier, URL (rtsp://...) ou index de webcam
+CAMERA_SOURCES = [
+    # {"name": "lit_1", "source": "rtsp://192.168.1.10/stream1"},
+    # {"name": "lit_2", "source": 0},
+]
+TELEMETRY_HOST = "127.0.0.1"     # Métriques Prometheus (telemetry.py) : /metrics sur cette adresse...
+TELEMETRY_PORT = 9108            # ...et ce port (None = désactivé)
+FRAME_QUEUE_SIZE = 2        # Frames en attente max par flux (les plus anciennes sont jetées)
+STATS_INTERVAL = 5.0        # Secondes entre deux rapports fps / latence
+FALL_REARM_SEC = 60.0       # Après une chute validée, nouvelle alerte possible au bout de ... s (None = jamais)
+# server.py --processes : un process décodeur par caméra, frames partagées (framebus.py)
+FRAME_BUS_SLOTS = 8         # Frames dans l'anneau partagé (mémoire : cases x taille d'une frame)
+FRAME_BUS_READERS = 4       # Consommateurs max par bus (détection, clips, aperçu)
+FRAME_BUS_POLL_SEC = 0.002  # Attente d'un lecteur entre deux vérifications de nouvelle frame
+
+# Métriques par frame (metrics.py), en mémoire constante
+METRICS_BUFFER = 4096       # Frames gardées en mémoire, écrites sur disque à chaque tour (~2 min à 30 fps)
+METRICS_MAX_FILES = 240     # Fichiers gardés par flux, les plus anciens sont supprimés (~9 h à 30 fps)
+METRICS_SUMMARY_SIZE = 2048 # Points min/max couvrant toute la durée du flux...
+METRICS_SUMMARY_BUCKET = 30 # ...de 30 frames chacun au départ (doublé à chaque fois que le résumé est plein)
+
+# Suite de tests (test_suite.py)
+SUITE_CV_THREADS = 1        # Threads OpenCV par process (le parallélisme vient du pool)
+SEGMENT_FRAMES = 1800       # Au-delà, une vidéo est extraite en segments parallèles de cette taille
+SEGMENT_WARMUP_SEC = 2.0    # Recouvrement analysé avant chaque segment (frame précédente, mode jour/nuit)
+BACKEND_FALL_TOLERANCE_SEC = 0.2    # --compare-backends : écart max entre frames de chute...
+BACKEND_BRIGHTNESS_TOLERANCE = 2.0  # ...et entre luminosités moyennes (niveaux de gris)
+IDLE_FALL_TOLERANCE_SEC = 0.2       # --synthetic : écart max de la chute avec / sans veille
 
 # Paramètres de Détection
-ANALYSIS_STRIDE = 5
-CONSECUTIVE_VALIDATIONS = 5 
-DARKNESS_THRESHOLD = 20
+# Echelle d'analyse : les masques sont calculés sur une image réduite (ex: 0.25 = 1/4).
+# Surfaces, positions et dy restent exprimés en pixels de la résolution d'origine,
+# les seuils ci-dessous n'ont donc pas à changer avec l'échelle.
+ANALYSIS_SCALE = 1.0
+MORPH_KERNEL = (5, 5)
+# Fps d'analyse visé : sur une source plus rapide (60/120 fps) on ne décode
+# complètement qu'une frame sur N (None = analyser toutes les frames)
+ANALYSIS_FPS = 30
+# Durées en secondes, converties en nombre de frames selon le fps analysé
+# (5 / 30 = les 5 frames historiques à 30 fps)
+ANALYSIS_STRIDE_SEC = 5 / 30
+CONSECUTIVE_VALIDATIONS_SEC = 5 / 30
+SMOOTHING_WINDOW_SEC = 5 / 30
+DARKNESS_THRESHOLD = 20          # Passage en mode nuit sous ce seuil...
+DARKNESS_HYSTERESIS = 2          # ...retour en mode jour seulement au-dessus de seuil + hystérésis
+MODE_MIN_DWELL_SEC = 0.5         # Durée minimale dans un mode avant de pouvoir rebasculer
+BRIGHTNESS_SUBSAMPLE = 4         # Luminosité estimée sur 1 pixel sur N (dans chaque direction)
+# Veille : scène immobile -> plus d'analyse complète, seule une vignette est comparée
+IDLE_AFTER_SEC = 3.0             # Immobilité avant la mise en veille (None = jamais)
+IDLE_SAMPLE_SEC = 0.1            # En veille, une vignette comparée toutes les ... secondes
+IDLE_WAKE_RATIO = 0.1            # Mouvement (fraction de MIN_AREA du mode) qui réveille / empêche la veille
+IDLE_THUMB_STEP = 8              # Vignette : 1 pixel pour N x N pixels natifs
+# Blobs de mouvement (composantes connexes) : le corps est suivi d'une frame à l'autre
+# Seuils absolus (px² natifs), indépendants de MIN_AREA : changer MIN_AREA ne demande qu'un rejeu
+DAY_BLOB_MIN_PX = 1000           # Blobs plus petits ignorés (bruit), jour...
+NIGHT_BLOB_MIN_PX = 400          # ...et nuit
+DAY_BODY_MIN_PX = 20000          # Blob suivi plus petit : pas un corps, le blob dominant le remplace (jour)...
+NIGHT_BODY_MIN_PX = 8000         # ...et nuit
+BLOB_MERGE_PX = 40               # Blobs à moins de ... px natifs du blob principal : même corps
+BLOB_SWITCH_RATIO = 2.0          # Un autre blob ... fois plus grand que le blob suivi devient le corps
+BLOB_FORGET_SEC = 1.0            # Sans mouvement pendant ... s, le corps suivi est oublié
+BLOB_MASK_SCALE = 1.0            # Composantes sur le masque réduit d'autant (1.0 = échelle d'analyse)
 MAX_DY = 250  
-SMOOTHING_WINDOW = 5 
 
 # Réglages Image (Gamma/Contrast)
 USER_GAMMA = 2.9
@@ -0,0 +1,649 @@
+import cv2
+import numpy as np
+from collections import deque, namedtuple
+from dataclasses import dataclass
+import config as cfg
+
+# =========================================
+#   MOTEUR DE DETECTION (partagé)
+# =========================================
+
+def scaled_ksize(ksize, scale):
+    """Taille de noyau (impaire, >= 1) équivalente à l'échelle d'analyse."""
+    return tuple(max(1, int(round(k * scale)) | 1) for k in ksize)
+
+def downscale(img, scale, bufs=None):
+    """
+    Réduit l'image par moyennage (INTER_AREA). Les réductions par 2 successives
+    profitent du chemin rapide d'OpenCV, bien plus rapide qu'un seul resize à 1/4.
+    `bufs` : liste de buffers de sortie réutilisés d'un appel à l'autre.
+    """
+    factors = []
+    while scale <= 0.5:
+        factors.append(0.5)
+        scale *= 2
+    if scale < 1.0:
+        factors.append(scale)
+
+    for i, f in enumerate(factors):
+        dst = bufs[i] if bufs is not None and i < len(bufs) else None
+        img = cv2.resize(img, None, fx=f, fy=f, interpolation=cv2.INTER_AREA, dst=dst)
+        if bufs is not None:
+            if i < len(bufs): bufs[i] = img
+            else: bufs.append(img)
+    return img
+
+def scaled_size(width, height, scale):
+    """Taille (largeur, hauteur) de l'image produite par downscale(scale)."""
+    while scale <= 0.5:
+        width, height = round(width * 0.5), round(height * 0.5)
+        scale *= 2
+    if scale < 1.0:
+        width, height = round(width * scale), round(height * scale)
+    return width, height
+
+def seconds_to_frames(seconds, fps):
+    """Convertit une durée de config en nombre de frames analysées (>= 1)."""
+    return max(1, int(round(seconds * fps)))
+
+def estimate_brightness(gray, step=1):
+    """Luminosité moyenne estimée sur une grille d'1 pixel sur `step` (vue, sans copie)."""
+    return np.mean(gray[::step, ::step]) if step > 1 else np.mean(gray)
+
+def motion_blobs(mask, min_px, labels=None):
+    """
+    Composantes connexes du masque en un seul passage. Retourne (surfaces, boites
+    (x, y, w, h), centroïdes (x, y)) des blobs d'au moins `min_px` pixels, et le
+    buffer des labels (réutilisable). Algorithme de Grana (BBDT) : ~3x plus rapide
+    ici que celui choisi par défaut en 8-connexité.
+    """
+    _, labels, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+        mask, 8, cv2.CV_32S, cv2.CCL_GRANA, labels)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = areas >= min_px  # Filtre vectorisé, le fond (label 0) est déjà exclu
+    return areas[keep], stats[1:, :4][keep], centroids[1:][keep], labels
+
+def boxes_near(boxes, box, gap):
+    """Masque des boites (N, 4) à moins de `gap` pixels de `box` (x, y, w, h)."""
+    x, y, w, h = box
+    return ((boxes[:, 0] <= x + w + gap) & (boxes[:, 0] + boxes[:, 2] >= x - gap) &
+            (boxes[:, 1] <= y + h + gap) & (boxes[:, 1] + boxes[:, 3] >= y - gap))
+
+# =========================================
+#   ORIENTATION / ZONE DU LIT
+# =========================================
+# L'analyse se fait sur l'image native ; seules les coordonnées sont ramenées
+# dans le repère "debout" (y vers le sol) défini par cfg.ORIENTATION.
+
+def upright_point(x, y, width, height, orientation):
+    """(x, y) de l'image native (width x height) -> repère debout."""
+    if orientation == "90_CW": return (height - 1 - y, x)
+    if orientation == "90_CCW": return (y, width - 1 - x)
+    if orientation == "180": return (width - 1 - x, height - 1 - y)
+    return (x, y)
+
+def upright_bbox(x, y, w, h, width, height, orientation):
+    """Boite (x, y, w, h) de l'image native -> repère debout."""
+    if orientation == "90_CW": return (height - y - h, x, h, w)
+    if orientation == "90_CCW": return (y, width - x - w, h, w)
+    if orientation == "180": return (width - x - w, height - y - h, w, h)
+    return (x, y, w, h)
+
+def upright_image(img, orientation):
+    """Rotation réelle de l'image, uniquement pour l'affichage."""
+    codes = {"90_CW": cv2.ROTATE_90_CLOCKWISE, "90_CCW": cv2.ROTATE_90_COUNTERCLOCKWISE, "180": cv2.ROTATE_180}
+    return cv2.rotate(img, codes[orientation]) if orientation in codes else img
+
+def roi_rect(roi, width, height):
+    """Rectangle englobant (x0, y0, x1, y1) en pixels du polygone `roi` (fractions 0-1)."""
+    if not roi: return (0, 0, width, height)
+    xs = [min(max(px, 0.0), 1.0) * width for px, _ in roi]
+    ys = [min(max(py, 0.0), 1.0) * height for _, py in roi]
+    x0, y0 = int(np.floor(min(xs))), int(np.floor(min(ys)))
+    x1, y1 = int(np.ceil(max(xs))), int(np.ceil(max(ys)))
+    return (x0, y0, max(x1, x0 + 1), max(y1, y0 + 1))
+
+def roi_mask(roi, width, height, rect, shape):
+    """Masque 0/255 du polygone, à la taille `shape` du crop analysé."""
+    x0, y0, x1, y1 = rect
+    sx, sy = shape[1] / (x1 - x0), shape[0] / (y1 - y0)
+    pts = np.array([[(px * width - x0) * sx, (py * height - y0) * sy] for px, py in roi], np.int32)
+    mask = np.zeros(shape[:2], np.uint8)
+    cv2.fillPoly(mask, [pts], 255)
+    return mask
+
+
+# =========================================
+#   PARAMETRES
+# =========================================
+
+# Paramètres de décision : ils n'agissent que sur la logique dy / compteur, pas sur
+# les images. On peut donc les surcharger par détecteur (réglage, rejeu de traces).
+DECISION_PARAMS = (
+    "DAY_MIN_AREA", "NIGHT_MIN_AREA", "DY_DAY_THRESHOLD", "DY_NIGHT_THRESHOLD", "MAX_DY",
+    "ANALYSIS_STRIDE_SEC", "SMOOTHING_WINDOW_SEC", "CONSECUTIVE_VALIDATIONS_SEC",
+)
+
+def decision_params(overrides=None):
+    """Valeurs de config.py pour DECISION_PARAMS, éventuellement surchargées."""
+    params = {name: getattr(cfg, name) for name in DECISION_PARAMS}
+    if overrides:
+        unknown = set(overrides) - set(DECISION_PARAMS)
+        if unknown: raise ValueError(f"Paramètres de décision inconnus : {sorted(unknown)}")
+        params.update(overrides)
+    return params
+
+# Paramètres d'un mode de lumière, construits une seule fois par détecteur
+LightMode = namedtuple("LightMode", "is_night blur clahe threshold min_area dy_threshold")
+
+def build_light_modes(scale=1.0, params=None):
+    """Retourne (mode_jour, mode_nuit) avec noyaux de flou et objet CLAHE déjà créés."""
+    p = params or decision_params()
+    day = LightMode(False, scaled_ksize(cfg.DAY_BLUR, scale), None,
+                    cfg.DAY_THRESHOLD, p["DAY_MIN_AREA"], p["DY_DAY_THRESHOLD"])
+    night = LightMode(True, scaled_ksize(cfg.NIGHT_BLUR, scale),
+                      cv2.createCLAHE(clipLimit=cfg.NIGHT_CLAHE, tileGridSize=(8, 8)),
+                      cfg.NIGHT_THRESHOLD, p["NIGHT_MIN_AREA"], p["DY_NIGHT_THRESHOLD"])
+    return day, night
+
+def apply_light_condition(gray, mode, dst=None, bufs=None):
+    """
+    Applique le pré-traitement du mode (flou, puis CLAHE la nuit).
+    `dst` : buffer de sortie optionnel ; `bufs` : dict de buffers intermédiaires réutilisés.
+    """
+    if mode.clahe is not None:
+        blur = cv2.GaussianBlur(gray, mode.blur, 0, dst=bufs.get("blur") if bufs is not None else None)
+        if bufs is not None: bufs["blur"] = blur
+        return mode.clahe.apply(blur, dst=dst)
+    return cv2.GaussianBlur(gray, mode.blur, 0, dst=dst)
+
+
+@dataclass
+class FrameResult:
+    """Résultat de l'analyse d'une frame (stats + infos d'affichage)."""
+    frame_idx: int
+    brightness: float
+    is_night: bool
+    area: float = 0
+    min_area: float = 0
+    dy: int = 0
+    dy_threshold: int = 0
+    fall_counter: int = 0
+    x_center: int = None            # Coordonnées pleine résolution, repère debout
+    y_raw: int = None
+    y_smooth: int = None
+    bbox: tuple = None
+    is_horizontal: bool = False
+    fall_detected: bool = False     # True uniquement sur la frame de validation
+    mode_switched: bool = False     # Bascule jour/nuit sur cette frame
+    measured: bool = False          # Mouvement mesuré (frame précédente disponible, hors veille)
+    idle: bool = False              # Frame passée en veille (pas d'analyse complète)
+    body_switched: bool = False     # Le blob suivi a changé : historique de y repris à zéro
+    gray_active: np.ndarray = None  # Image pré-traitée (native, crop du lit, échelle d'analyse).
+                                    # Buffer réutilisé : valide jusqu'au prochain process()
+
+
+class FallDetector:
+    """
+    Etat de détection d'UN flux vidéo.
+    On lui donne les frames une par une via process(frame), quelle que soit la source.
+
+    Les masques sont calculés à l'échelle `scale` (cfg.ANALYSIS_SCALE par défaut) ;
+    surface, centroïde, boite et dy sont ramenés en pixels de la frame d'origine.
+
+    `fps` est la cadence des frames réellement passées à process() : les fenêtres
+    de config (en secondes) sont converties en nombre de frames à partir de lui.
+
+    Les frames sont analysées dans leur orientation native, éventuellement
+    restreintes à la zone du lit (`bed_roi`) ; centroïde et boite sont rendus
+    dans le repère debout de `orientation`.
+
+    process() accepte aussi des frames déjà en niveaux de gris et réduites par le
+    décodeur (sources.py) : `source_size` donne alors la taille native de la source.
+
+    Le mouvement est découpé en blobs (composantes connexes) : seul le corps, suivi
+    d'une frame à l'autre, donne surface, centroïde, boite et posture. Une couverture
+    qui bouge à côté ne décale plus le centroïde.
+
+    Une seule chute est validée par défaut (analyse d'une vidéo) ; un flux continu
+    fixe `rearm_after` (frames) pour être réarmé ce délai après chaque chute.
+
+    Veille : après `idle_after_sec` sans mouvement (cfg.IDLE_AFTER_SEC par défaut,
+    0 = jamais), process() ne compare plus qu'une vignette à basse cadence et
+    repasse en analyse complète dès que le mouvement dépasse IDLE_WAKE_RATIO x MIN_AREA.
+    """
+
+    def __init__(self, fps=30.0, scale=None, orientation=None, bed_roi=None, params=None, idle_after_sec=None):
+        self.fps = fps
+        self.scale = cfg.ANALYSIS_SCALE if scale is None else scale
+        self.orientation = cfg.ORIENTATION if orientation is None else orientation
+        self.bed_roi = cfg.BED_ROI if bed_roi is None else bed_roi
+        self.roi_rect = None  # (x0, y0, x1, y1) en pixels natifs, connu à la 1ère frame
+        self.source_size = None  # (largeur, hauteur) native si les frames arrivent déjà réduites
+        self.kernel = np.ones(scaled_ksize(cfg.MORPH_KERNEL, self.scale), np.uint8)
+        self.params = decision_params(params)
+        self.day_mode, self.night_mode = build_light_modes(self.scale, self.params)
+
+        self.max_dy = self.params["MAX_DY"]
+        self.stride = seconds_to_frames(self.params["ANALYSIS_STRIDE_SEC"], fps)
+        self.smoothing = seconds_to_frames(self.params["SMOOTHING_WINDOW_SEC"], fps)
+        self.validations = seconds_to_frames(self.params["CONSECUTIVE_VALIDATIONS_SEC"], fps)
+        self.mode_dwell = int(round(cfg.MODE_MIN_DWELL_SEC * fps))
+        if idle_after_sec is None: idle_after_sec = cfg.IDLE_AFTER_SEC
+        self.idle_after = seconds_to_frames(idle_after_sec, fps) if idle_after_sec else 0
+        self.idle_sample = seconds_to_frames(cfg.IDLE_SAMPLE_SEC, fps)
+        self.rearm_after = 0  # 0 = pas de nouvelle chute après la première
+        # Seuil de veille tiré de config.py, pas des paramètres surchargés (extraction à 0)
+        self.idle_area = (cfg.IDLE_WAKE_RATIO * cfg.DAY_MIN_AREA, cfg.IDLE_WAKE_RATIO * cfg.NIGHT_MIN_AREA)
+        self._idle_kernel = np.ones((2, 2), np.uint8)
+        # Suivi du corps : seuils propres (px² natifs), pas MIN_AREA, qui ne fait que filtrer au rejeu
+        self.blob_min = (cfg.DAY_BLOB_MIN_PX, cfg.NIGHT_BLOB_MIN_PX)
+        self.body_min = (cfg.DAY_BODY_MIN_PX, cfg.NIGHT_BODY_MIN_PX)  # Blob suivi trop petit pour un corps
+        self.body_forget = seconds_to_frames(cfg.BLOB_FORGET_SEC, fps)
+        self.blob_scale = cfg.BLOB_MASK_SCALE
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.prev_raw = None   # Frame précédente avant pré-traitement (pour le changement de mode)
+        # Buffers de travail réutilisés d'une frame à l'autre (alloués à la 1ère frame
+        # ou si la taille change) ; les *_spare reçoivent la frame courante puis sont
+        # échangés avec prev_gray / prev_raw
+        self._buf = {}
+        self._down_bufs = []
+        self._spare = None
+        self._raw_spare = None
+        self.mode = None
+        self._mode_frames = 0
+        self._frame_size = None
+        self._roi_mask = None
+        self.frame_idx = 0
+        self.frames_processed = 0
+        self.y_history = deque(maxlen=self.stride + 1)
+        self.y_buffer_smooth = deque(maxlen=self.smoothing)
+        self.fall_counter = 0
+        self.fall_detected = False
+        self.fall_frame = None
+        self._since_fall = 0
+        self.idle = False
+        self._still_frames = 0
+        self._idle_ref = None     # Vignette de la dernière frame regardée
+        self._idle_wait = 0
+        self._idle_brightness = 0.0
+        self._body = None         # Boite du corps suivi (pixels du masque des blobs)
+        self._body_missing = 0    # Frames de suite sans blob : le corps est oublié après body_forget
+
+    def process(self, frame, frame_idx=None):
+        """
+        Analyse une frame (BGR, ou grise déjà réduite) et retourne un FrameResult.
+        `frame_idx` : index dans la source (si des frames ont été sautées).
+        """
+        if frame_idx is not None: self.frame_idx = frame_idx
+        if self.idle:
+            res = self.idle_step(frame)
+            if res is not None: return self.end_frame(res)
+        b = self._buf
+
+        gray_raw = self.to_gray(frame, dst=self._raw_spare)
+        avg_brightness = estimate_brightness(gray_raw, cfg.BRIGHTNESS_SUBSAMPLE)
+
+        mode, switched = self.next_mode(avg_brightness)
+        gray_active = apply_light_condition(gray_raw, mode, dst=self._spare, bufs=b)
+
+        if switched:
+            # prev_gray a été traité avec l'autre pipeline (flou/CLAHE) : on le
+            # refait avec le nouveau mode pour éviter un faux pic de mouvement
+            self.prev_gray = apply_light_condition(self.prev_raw, mode, dst=self.prev_gray, bufs=b)
+
+        res = self.new_result(avg_brightness, mode, switched, gray_active)
+
+        if self.prev_gray is not None:
+            diff = b["diff"] = cv2.absdiff(gray_active, self.prev_gray, dst=b.get("diff"))
+            # Seuillage sur place, puis ouverture dans le buffer du masque
+            cv2.threshold(diff, mode.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            if self.bed_roi:
+                cv2.bitwise_and(diff, self.roi_mask_for(diff.shape), dst=diff)
+            motion_mask = b["mask"] = cv2.morphologyEx(diff, cv2.MORPH_OPEN, self.kernel, dst=b.get("mask"))
+            self.apply_motion(res, mode, *self.find_body(motion_mask, mode))
+
+        # Echange des buffers au lieu d'une copie
+        self.prev_gray, self._spare = gray_active, self.prev_gray
+        self.prev_raw, self._raw_spare = gray_raw, self.prev_raw
+
+        self.update_idle(res, mode, frame)
+        return self.end_frame(res)
+
+    # -----------------------------------------
+    #   Etapes (partagées avec le benchmark et le rejeu des traces)
+    # -----------------------------------------
+
+    def to_gray(self, frame, dst=None):
+        """
+        Crop de la zone du lit, réduction à l'échelle d'analyse et niveaux de gris.
+        Une frame 2D vient d'un décodeur qui a déjà fait gris + réduction : il ne
+        reste que le crop (et la fin de la réduction si son échelle est plus grande).
+        """
+        height, width = frame.shape[:2]
+        prepared = frame.ndim == 2
+        if prepared and self.source_size: width, height = self.source_size
+        if self._frame_size != (width, height):
+            self._frame_size = (width, height)
+            self.roi_rect = roi_rect(self.bed_roi, width, height)
+            self._roi_mask = None
+        x0, y0, x1, y1 = self.roi_rect
+
+        if prepared:
+            s = frame.shape[1] / width  # Echelle déjà appliquée par le décodeur
+            if self.bed_roi:
+                frame = frame[round(y0 * s):round(y1 * s), round(x0 * s):round(x1 * s)]
+            if self.scale / s < 0.99:    # Tailles arrondies : pas de réduction pour un pixel
+                frame = downscale(frame, self.scale / s)  # Nouveau tableau : gardé comme prev_raw
+            return frame
+
+        if self.bed_roi:
+            frame = frame[y0:y1, x0:x1]  # Vue, pas de copie
+
+        if self.scale != 1.0:
+            frame = downscale(frame, self.scale, self._down_bufs)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst)
+
+    def roi_mask_for(self, shape):
+        """Masque du polygone du lit à la taille du crop analysé (mis en cache)."""
+        if self._roi_mask is None or self._roi_mask.shape != shape[:2]:
+            width, height = self._frame_size
+            self._roi_mask = roi_mask(self.bed_roi, width, height, self.roi_rect, shape)
+        return self._roi_mask
+
+    def next_mode(self, brightness, has_prev=None):
+        """Mode de la frame courante ; retourne (mode, bascule_depuis_la_frame_precedente)."""
+        if has_prev is None: has_prev = self.prev_gray is not None
+        mode = self._select_mode(brightness)
+        switched = has_prev and mode is not self.mode
+        self.mode = mode
+        return mode, switched
+
+    def new_result(self, brightness, mode, switched, gray_active=None):
+        return FrameResult(frame_idx=self.frame_idx, brightness=brightness, is_night=mode.is_night,
+                           min_area=mode.min_area, dy_threshold=mode.dy_threshold, gray_active=gray_active,
+                           mode_switched=switched)
+
+    def find_body(self, mask, mode):
+        """
+        Blobs du masque de mouvement (connectedComponentsWithStats, un seul passage) puis
+        corps : le plus grand blob qui touche la boite du corps à la frame précédente, sauf
+        s'il est sous *_BODY_MIN_PX ou BLOB_SWITCH_RATIO fois plus petit que le plus grand blob
+        (alors celui-ci), plus les blobs à moins de BLOB_MERGE_PX (membres séparés par
+        l'ouverture). Le corps est oublié après BLOB_FORGET_SEC sans aucun blob.
+        Retourne (m00, m10, m01, boite, changé) à l'échelle d'analyse, comme moments +
+        boundingRect sur le seul corps ; `changé` : un autre objet que le précédent est suivi.
+        """
+        if not cv2.countNonZero(mask):  # Cas courant (scène calme) : pas d'étiquetage
+            return self.no_body()
+        b = self._buf
+        r = self.blob_scale
+        if r < 1.0:
+            # Plus proche voisin : le masque reste binaire
+            mask = b["blob_mask"] = cv2.resize(mask, None, fx=r, fy=r, interpolation=cv2.INTER_NEAREST,
+                                               dst=b.get("blob_mask"))
+        s = self.scale * r  # Echelle du masque des blobs par rapport à l'image native
+        min_px = self.blob_min[mode.is_night] * s * s
+        areas, boxes, centers, b["labels"] = motion_blobs(mask, min_px, b.get("labels"))
+        if not len(areas):
+            return self.no_body()
+        self._body_missing = 0
+
+        gap = cfg.BLOB_MERGE_PX * s
+        main = largest = int(np.argmax(areas))
+        switched = False
+        if self._body is not None:
+            tracked = boxes_near(boxes, self._body, gap)
+            if tracked.any():
+                main = int(np.argmax(np.where(tracked, areas, -1)))
+                # Le blob dominant (loin du corps suivi, sinon il serait `main`) l'emporte sur un
+                # blob suivi trop petit : objet qui bouge pendant que le corps est immobile
+                body_px = self.body_min[mode.is_night] * s * s
+                if main != largest and (areas[largest] > cfg.BLOB_SWITCH_RATIO * areas[main] or
+                                        areas[main] < body_px <= areas[largest]):
+                    main = largest
+                    switched = True
+            else:
+                switched = True
+
+        body = boxes_near(boxes, boxes[main], gap)
+        a = areas[body].astype(np.float64)
+        x0, y0 = boxes[body, 0].min(), boxes[body, 1].min()
+        x1, y1 = (boxes[body, 0] + boxes[body, 2]).max(), (boxes[body, 1] + boxes[body, 3]).max()
+        self._body = (x0, y0, x1 - x0, y1 - y0)
+
+        # Moments d'un masque 0/255 : m00 = 255 x surface, m10 / m00 = centroïde
+        m00 = 255.0 * a.sum()
+        m10 = m00 * (a @ centers[body, 0]) / a.sum()
+        m01 = m00 * (a @ centers[body, 1]) / a.sum()
+        if r < 1.0:
+            m00, m10, m01 = m00 / r ** 2, m10 / r ** 3, m01 / r ** 3
+            x0, y0, x1, y1 = (int(v / r) for v in (x0, y0, x1, y1))
+        return m00, m10, m01, (int(x0), int(y0), int(x1 - x0), int(y1 - y0)), switched
+
+    def no_body(self):
+        """Pas de blob dans le masque : retour de find_body, le corps suivi est oublié à terme."""
+        self._body_missing += 1
+        if self._body_missing >= self.body_forget: self._body = None
+        return 0.0, 0.0, 0.0, None, False
+
+    def restart_track(self):
+        """Le corps suivi a changé : son historique de y ne vaut plus pour le nouvel objet."""
+        self.y_history.clear()
+        self.y_buffer_smooth.clear()
+        self.fall_counter = 0
+
+    def rearm(self):
+        """Accepte une nouvelle chute (fall_frame garde la précédente jusque-là)."""
+        self.fall_detected = False
+        self._since_fall = 0
+        self.restart_track()
+
+    def apply_motion(self, res, mode, m00, m10, m01, rect, switched=False):
+        """
+        Met à jour l'état de détection à partir des moments du corps (à l'échelle
+        d'analyse) et de sa boite englobante `rect` (cf. find_body).
+        """
+        res.measured = True
+        if switched:
+            res.body_switched = True
+            self.restart_track()
+        # Surface en pixels² de la résolution d'origine
+        res.area = m00 / (self.scale ** 2)
+
+        if res.area > mode.min_area:
+            self.measure(res, m00, m10, m01, rect)
+            self.update_state(res, mode, res.y_raw)
+        else:
+            self.update_state(res, mode, None)
+
+    def measure(self, res, m00, m10, m01, rect):
+        """Centroïde, boite et posture dans le repère debout, en pixels pleine résolution."""
+        s = self.scale
+        width, height = self._frame_size
+        x0, y0 = self.roi_rect[:2]
+
+        cx = x0 + m10 / m00 / s
+        cy = y0 + m01 / m00 / s
+        ux, uy = upright_point(cx, cy, width, height, self.orientation)
+        res.y_raw = int(uy)
+        res.x_center = int(ux)
+
+        x, y, w, h = rect
+        if self.orientation in ("90_CW", "90_CCW"): w_up, h_up = h, w
+        else: w_up, h_up = w, h
+        res.is_horizontal = w_up*1.2 >= h_up
+        bbox = upright_bbox(x0 + x / s, y0 + y / s, w / s, h / s, width, height, self.orientation)
+        res.bbox = tuple(int(v) for v in bbox)
+
+    def update_state(self, res, mode, y_raw):
+        """
+        Partie à état : lissage, historique, dy et compteur.
+        `y_raw` vaut None quand la surface de mouvement est sous le minimum du mode.
+        """
+        if y_raw is None:
+            if len(self.y_history) > 0: self.y_history.popleft()
+            self.y_buffer_smooth.clear()
+            self.fall_counter = 0
+            return
+
+        # Lissage
+        self.y_buffer_smooth.append(y_raw)
+        res.y_smooth = int(sum(self.y_buffer_smooth) / len(self.y_buffer_smooth))
+
+        self.y_history.append(res.y_smooth)
+        self._update_fall_state(res)
+
+    # -----------------------------------------
+    #   Veille (scène immobile)
+    # -----------------------------------------
+
+    def thumbnail(self, frame, mode):
+        """
+        Vignette de la zone du lit, 1 pixel pour IDLE_THUMB_STEP² pixels natifs : on ne
+        lit qu'un pixel sur IDLE_THUMB_STEP / 2 (vue) puis on moyenne par 2x2 ; flou 3x3
+        et CLAHE la nuit. Retourne (vignette, luminosité, pas en pixels natifs).
+        """
+        x0, y0, x1, y1 = self.roi_rect
+        s = frame.shape[1] / self._frame_size[0]  # 1 en BGR natif, échelle du décodeur sinon
+        k = max(1, round(cfg.IDLE_THUMB_STEP * s / 2))
+        view = frame[round(y0 * s):round(y1 * s):k, round(x0 * s):round(x1 * s):k]
+        gray = cv2.cvtColor(view, cv2.COLOR_BGR2GRAY) if view.ndim == 3 else np.ascontiguousarray(view)
+        # Moyenne et flou : le bruit du capteur ne doit pas réveiller le flux
+        thumb = cv2.GaussianBlur(downscale(gray, 0.5), (3, 3), 0)
+        if mode.clahe is not None: thumb = mode.clahe.apply(thumb)
+        return thumb, float(np.mean(gray)), 2 * k / s
+
+    def update_idle(self, res, mode, frame):
+        """Après une analyse complète : entrée en veille après `idle_after` frames immobiles."""
+        if not self.idle_after: return
+        still = res.area < self.idle_area[mode.is_night] and self.fall_counter == 0 and not self.y_history
+        self._still_frames = self._still_frames + 1 if still else 0
+        if self._still_frames >= self.idle_after:
+            self.idle = True
+            self._idle_ref = self.thumbnail(frame, mode)[0]
+            self._idle_wait = self.idle_sample
+            self._idle_brightness = res.brightness
+
+    def idle_step(self, frame):
+        """
+        Frame en veille : seule une frame sur `idle_sample` est regardée, via sa vignette
+        comparée à celle de la précédente frame regardée.
+        Retourne le FrameResult, ou None au réveil : la frame repart alors dans
+        l'analyse complète comme une 1ère frame (historique déjà vide, cf. update_idle).
+        """
+        self._idle_wait -= 1
+        if self._idle_wait <= 0:
+            self._idle_wait = self.idle_sample
+            previous = self.mode
+            thumb, brightness, k = self.thumbnail(frame, previous)
+            mode, _ = self.next_mode(brightness, has_prev=False)
+            self._idle_brightness = brightness
+            wake = mode is not previous or thumb.shape != self._idle_ref.shape
+            if not wake:
+                diff = cv2.absdiff(thumb, self._idle_ref)
+                cv2.threshold(diff, mode.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+                # Ouverture 2x2 : un pixel de vignette isolé (bruit) ne réveille pas
+                changed = cv2.countNonZero(cv2.morphologyEx(diff, cv2.MORPH_OPEN, self._idle_kernel))
+                wake = changed * k * k * 255 >= self.idle_area[mode.is_night]  # Unités de res.area
+            self._idle_ref = thumb
+            if wake:
+                self.idle = False
+                self._still_frames = 0
+                self.prev_gray = self.prev_raw = None
+                self._body = None  # Scène immobile depuis la mise en veille : pas de corps suivi
+                self.mode = None  # Choisi à nouveau sur l'image complète
+                return None
+
+        res = self.new_result(self._idle_brightness, self.mode, False)
+        res.idle = True
+        return res
+
+    def end_frame(self, res):
+        res.fall_counter = self.fall_counter
+        if self.fall_detected and self.rearm_after:
+            self._since_fall += 1
+            if self._since_fall > self.rearm_after: self.rearm()
+        self.frame_idx += 1
+        self.frames_processed += 1
+        return res
+
+    def _select_mode(self, brightness):
+        """
+        Choix jour/nuit avec hystérésis : nuit sous DARKNESS_THRESHOLD, retour jour
+        au-dessus de DARKNESS_THRESHOLD + DARKNESS_HYSTERESIS, et pas de nouveau
+        basculement avant MODE_MIN_DWELL_SEC.
+        """
+        if self.mode is None:
+            return self.night_mode if brightness < cfg.DARKNESS_THRESHOLD else self.day_mode
+
+        self._mode_frames += 1
+        if self._mode_frames < self.mode_dwell:
+            return self.mode
+
+        if self.mode.is_night and brightness >= cfg.DARKNESS_THRESHOLD + cfg.DARKNESS_HYSTERESIS:
+            self._mode_frames = 0
+            return self.day_mode
+        if not self.mode.is_night and brightness < cfg.DARKNESS_THRESHOLD:
+            self._mode_frames = 0
+            return self.night_mode
+        return self.mode
+
+    def _update_fall_state(self, res):
+        """Logique dy / compteur de validation (petite partie à état)."""
+        if len(self.y_history) <= self.stride:
+            return
+
+        dy = self.y_history[-1] - self.y_history[0]
+        if abs(self.y_history[-1] - self.y_history[-2]) < 3: dy = 0
+        res.dy = dy
+
+        if (dy > res.dy_threshold) and (dy < self.max_dy) and res.is_horizontal:
+            self.fall_counter += 1
+        else:
+            if self.fall_counter > 0: self.fall_counter -= 1
+
+        if (not self.fall_detected) and self.fall_counter >= self.validations:
+            self.fall_detected = True
+            self.fall_frame = self.frame_idx
+            res.fall_detected = True
+
+
+# =========================================
+#   LECTURE VIDEO
+# =========================================
+
+def frame_step(source_fps, analysis_fps=None):
+    """Nombre de frames source pour une frame analysée (1 = toutes)."""
+    if not analysis_fps or analysis_fps >= source_fps:
+        return 1
+    return max(1, int(round(source_fps / analysis_fps)))
+
+def iter_frames(cap, step=1, start=0):
+    """
+    Parcourt une capture en n'appelant retrieve() (conversion + copie BGR)
+    que sur une frame sur `step` ; les autres sont seulement passées avec grab().
+    Produit (index_frame_source, frame). `start` : index de la 1ère frame lue
+    (capture déjà positionnée par l'appelant, multiple de `step`).
+    """
+    idx = start
+    while cap.grab():
+        if idx % step == 0:
+            ret, frame = cap.retrieve()
+            if not ret: break
+            yield idx, frame
+        idx += 1
+
+def open_capture(source, analysis_fps=None, scale=None, params=None):
+    """
+    Ouvre une source et prépare le détecteur adapté à son fps.
+    Retourne (cap, step, detector) ; cap.isOpened() est à vérifier par l'appelant.
+    """
+    if analysis_fps is None: analysis_fps = cfg.ANALYSIS_FPS
+    cap = cv2.VideoCapture(source)
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = frame_step(source_fps, analysis_fps)
+    return cap, step, FallDetector(fps=source_fps / step, scale=scale, params=params)
@@ -0,0 +1,199 @@
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+import config as cfg
+
+# =========================================
+#   BUS DE FRAMES EN MEMOIRE PARTAGEE
+# =========================================
+#
+# Un process décodeur écrit chaque frame une seule fois dans un anneau de
+# `slots` cases (multiprocessing.shared_memory) ; les consommateurs (détection,
+# clips, aperçu), dans d'autres process, la lisent comme une vue NumPy, sans copie
+# ni pickle. Ajouter un consommateur n'ajoute pas de copie de frame.
+#
+# Chaque case porte un numéro de séquence : -1 pendant l'écriture, puis le numéro
+# de la frame. Un lecteur en retard de plus de `max_lag` frames saute les plus
+# anciennes (comptées comme jetées) : il reste au moins slots - max_lag frames
+# avant que sa vue soit réécrite, et valid(seq) dit si elle l'a été. Un consommateur
+# qui lit la vue directement la rend avec release(seq), qui dit si elle est restée
+# intacte ; seul celui qui la garde au-delà (frame grise gardée comme frame
+# précédente par la détection) la sort avec copy().
+#
+# Mémoire : [entête int64][séquences][index source][temps][lecteurs][cases]
+
+_HEAD, _CLOSED = 0, 1
+_CTRL = 4  # Entiers de contrôle (2 réservés)
+
+
+class FrameBus:
+    def __init__(self, shm, shape, dtype, slots, readers, owner):
+        self.shm = shm
+        self.shape, self.dtype = tuple(shape), np.dtype(dtype)
+        self.slots, self.readers = slots, readers
+        self.owner = owner
+
+        buf = shm.buf
+        offset = 0
+        def take(dtype, shape):
+            nonlocal offset
+            arr = np.ndarray(shape, dtype, buffer=buf, offset=offset)
+            offset += arr.nbytes
+            return arr
+        self.ctrl = take(np.int64, (_CTRL,))
+        self.seq = take(np.int64, (slots,))
+        self.frame_idx = take(np.int64, (slots,))
+        self.stamp = take(np.float64, (slots,))
+        self.reader_state = take(np.int64, (readers, 2))  # Position, frames jetées
+        offset = -(-offset // 64) * 64  # Cases alignées sur une ligne de cache
+        self.data = take(self.dtype, (slots,) + self.shape)
+
+    @staticmethod
+    def _size(shape, dtype, slots, readers):
+        header = 8 * (_CTRL + 3 * slots + 2 * readers)
+        return -(-header // 64) * 64 + slots * int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+    @classmethod
+    def create(cls, shape, dtype=np.uint8, slots=cfg.FRAME_BUS_SLOTS, readers=cfg.FRAME_BUS_READERS):
+        """Nouveau bus (côté écrivain) pour des frames de forme `shape`."""
+        shm = shared_memory.SharedMemory(create=True, size=cls._size(shape, dtype, slots, readers))
+        bus = cls(shm, shape, dtype, slots, readers, owner=True)
+        bus.ctrl[:] = 0
+        bus.ctrl[_HEAD] = -1
+        bus.seq[:] = -1
+        bus.reader_state[:] = 0
+        bus.reader_state[:, 0] = -1
+        return bus
+
+    @classmethod
+    def attach(cls, spec):
+        """Ouvre un bus existant à partir de `bus.spec` (passé au process consommateur)."""
+        name, shape, dtype, slots, readers = spec
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, slots, readers, owner=False)
+
+    @property
+    def spec(self):
+        """Description picklable du bus : (nom, forme, dtype, cases, lecteurs)."""
+        return self.shm.name, self.shape, self.dtype.str, self.slots, self.readers
+
+    # -----------------------------------------
+    #   Ecrivain
+    # -----------------------------------------
+
+    def publish(self, frame, frame_idx):
+        """Copie `frame` dans la case suivante (seule copie du pipeline) ; retourne son numéro."""
+        seq = int(self.ctrl[_HEAD]) + 1
+        slot = seq % self.slots
+        self.seq[slot] = -1  # Case en cours d'écriture
+        dst = self.data[slot]
+        if frame.shape == self.shape:
+            np.copyto(dst, frame)
+        else:
+            # Reconnexion dans une autre résolution : remise à la taille du bus
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+        self.frame_idx[slot] = frame_idx
+        self.stamp[slot] = time.perf_counter()
+        self.seq[slot] = seq
+        self.ctrl[_HEAD] = seq
+        return seq
+
+    def end(self):
+        """Fin du flux : les lecteurs s'arrêtent après la dernière frame."""
+        self.ctrl[_CLOSED] = 1
+
+    # -----------------------------------------
+    #   Lecteurs
+    # -----------------------------------------
+
+    def reader(self, reader_id, max_lag=None):
+        return BusReader(self, reader_id, max_lag)
+
+    @property
+    def head(self):
+        return int(self.ctrl[_HEAD])
+
+    @property
+    def closed(self):
+        return bool(self.ctrl[_CLOSED])
+
+    def lag(self, reader_id):
+        """Frames publiées pas encore lues par ce lecteur."""
+        pos = int(self.reader_state[reader_id, 0])
+        return max(0, self.head - pos) if pos >= 0 else 0
+
+    def dropped(self, reader_id):
+        return int(self.reader_state[reader_id, 1])
+
+    def close(self):
+        # Les vues NumPy doivent disparaître avant de fermer le segment
+        self.ctrl = self.seq = self.frame_idx = self.stamp = self.reader_state = self.data = None
+        self.shm.close()
+        if self.owner:
+            try: self.shm.unlink()  # Les process encore attachés gardent leur mapping
+            except FileNotFoundError: pass
+
+
+class BusReader:
+    """
+    Curseur d'un consommateur. Itérer donne (seq, index_source, temps_publication, vue),
+    depuis les frames encore dans l'anneau, jusqu'à la fin du flux.
+    """
+
+    def __init__(self, bus, reader_id, max_lag=None):
+        self.bus = bus
+        self.id = reader_id
+        self.max_lag = max(1, min(max_lag or bus.slots // 2, bus.slots - 1))
+        self.pos = max(-1, bus.head - self.max_lag)  # Frames encore sûres à lire
+
+    def next(self, timeout=None):
+        """Prochaine frame, ou None en fin de flux / après `timeout` secondes."""
+        bus = self.bus
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            closed = bus.closed  # Lu avant la tête : la dernière frame publiée n'est pas perdue
+            head = bus.head
+            if head > self.pos:
+                seq = max(self.pos + 1, head - self.max_lag + 1)  # Drop-oldest
+                slot = seq % bus.slots
+                idx, stamp = int(bus.frame_idx[slot]), float(bus.stamp[slot])
+                skipped = seq - self.pos - 1
+                self.pos = seq
+                if bus.seq[slot] != seq:  # Réécrite entre-temps : on repart de la tête
+                    skipped += 1
+                    seq = None
+                state = bus.reader_state[self.id]
+                state[0] = self.pos
+                if skipped: state[1] += skipped
+                if seq is not None:
+                    return seq, idx, stamp, bus.data[slot]
+                continue
+            if closed:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            time.sleep(cfg.FRAME_BUS_POLL_SEC)
+
+    def valid(self, seq):
+        """True si la case de `seq` n'a pas été réécrite (à vérifier après usage de la vue)."""
+        return self.bus.seq[seq % self.bus.slots] == seq
+
+    def release(self, seq):
+        """Fin d'usage de la vue de `seq` : False si la case a été réécrite entre-temps (frame comptée jetée)."""
+        if self.valid(seq): return True
+        self.bus.reader_state[self.id, 1] += 1
+        return False
+
+    def copy(self, seq, view, dst):
+        """
+        Copie la vue de `seq` dans `dst` (buffer du consommateur). False si la case a été
+        réécrite pendant la copie : `dst` est alors incohérent et la frame comptée jetée.
+        """
+        np.copyto(dst, view)
+        return self.release(seq)
+
+    def __iter__(self):
+        while True:
+            item = self.next()
+            if item is None: return
+            yield item
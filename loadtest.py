@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import logging
+import contextlib
+import http.client
+import concurrent.futures
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+import config as cfg
+
+# =========================================
+#   TEST DE CHARGE DU DASHBOARD (app.py)
+# =========================================
+#
+# Lance app.py en local (base SQLite temporaire), connecte N dashboards au flux
+# SSE, envoie une rafale d'alertes depuis plusieurs threads et mesure :
+#   - le débit d'ingestion des POST
+#   - la part d'alertes reçues par chaque dashboard et leur délai de réception.
+#
+#   python loadtest.py --clients 300 --alerts 500
+#
+# --ingest : compare le débit d'écriture de la route simple (/api/alert) et de la
+# route groupée (/api/alerts/batch) pour le même nombre d'événements.
+#
+#   python loadtest.py --ingest --alerts 5000 --batch-size 100
+
+HOST = "127.0.0.1"
+
+
+def start_app(port):
+    """Démarre app.py dans un thread avec un historique vide ; retourne le serveur."""
+    cfg.ALERTS_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="fallcall-"), "alerts.db")
+    import app
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # Pas de ligne de log par requête
+    server = make_server(HOST, port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, app
+
+
+class Dashboard(threading.Thread):
+    """Client SSE minimal : note l'heure de réception de chaque alerte (par numéro de frame)."""
+
+    def __init__(self, port, ready):
+        super().__init__(daemon=True)
+        self.port = port
+        self.ready = ready
+        self.received = {}
+
+    def run(self):
+        conn = http.client.HTTPConnection(HOST, self.port, timeout=60)
+        conn.request("GET", "/api/alerts/stream")
+        resp = conn.getresponse()
+        self.ready.release()
+        try:
+            for line in resp:
+                if line.startswith(b"data: "):
+                    self.received[json.loads(line[6:])["frame"]] = time.perf_counter()
+        except (OSError, http.client.HTTPException):
+            pass
+
+
+def post_alerts(port, seqs, sent_at):
+    session = requests.Session()
+    for seq in seqs:
+        sent_at[seq] = time.perf_counter()
+        session.post(f"http://{HOST}:{port}/api/alert",
+                     json={"frame": seq, "time": seq / 30, "source": f"lit_{seq % 16}"}, timeout=10)
+
+
+def post_batches(port, events, batch_size):
+    session = requests.Session()
+    for i in range(0, len(events), batch_size):
+        session.post(f"http://{HOST}:{port}/api/alerts/batch", json={"events": events[i:i + batch_size]}, timeout=30)
+
+
+def bench_ingest(port, n_events, batch_size, senders):
+    """Débit (événements/s) des deux routes d'écriture, événements tous distincts."""
+    def events(offset):
+        return [{"frame": offset + i, "time": i / 30, "source": f"lit_{i % 16}"} for i in range(n_events)]
+
+    results = {}
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        with concurrent.futures.ThreadPoolExecutor(senders) as executor:
+            t0 = time.perf_counter()
+            list(executor.map(post_alerts, [port] * senders, [range(i, n_events, senders) for i in range(senders)],
+                              [{}] * senders))
+            results["single"] = n_events / (time.perf_counter() - t0)
+
+            evts = events(n_events)
+            t0 = time.perf_counter()
+            list(executor.map(post_batches, [port] * senders, [evts[i::senders] for i in range(senders)],
+                              [batch_size] * senders))
+            results["batch"] = n_events / (time.perf_counter() - t0)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge SSE / ingestion d'alertes")
+    parser.add_argument("--clients", type=int, default=200, help="Dashboards connectés en SSE")
+    parser.add_argument("--alerts", type=int, default=500, help="Alertes envoyées dans la rafale")
+    parser.add_argument("--senders", type=int, default=8, help="Threads qui postent les alertes")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--ingest", action="store_true", help="Benchmark route simple / route groupée")
+    parser.add_argument("--batch-size", type=int, default=100, help="Evénements par requête groupée")
+    args = parser.parse_args()
+
+    server, app = start_app(args.port)
+
+    if args.ingest:
+        rates = bench_ingest(args.port, args.alerts, args.batch_size, args.senders)
+        server.shutdown()
+        print(f"--- INGESTION ({args.alerts} événements, {args.senders} émetteurs) ---")
+        print(f"/api/alert          : {rates['single']:8.0f} événements/s")
+        print(f"/api/alerts/batch   : {rates['batch']:8.0f} événements/s (lots de {args.batch_size})")
+        print(f"Gain                : x{rates['batch'] / rates['single']:.1f}")
+        raise SystemExit
+
+    ready = threading.Semaphore(0)
+    dashboards = [Dashboard(args.port, ready) for _ in range(args.clients)]
+    for d in dashboards: d.start()
+    for _ in dashboards: ready.acquire()
+    while len(app.broadcaster) < args.clients: time.sleep(0.01)
+    print(f"--- {args.clients} dashboards connectés ---")
+
+    sent_at = {}
+    seqs = list(range(args.alerts))
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):  # app.py affiche chaque alerte
+        with concurrent.futures.ThreadPoolExecutor(args.senders) as executor:
+            list(executor.map(post_alerts, [args.port] * args.senders, [seqs[i::args.senders] for i in range(args.senders)],
+                              [sent_at] * args.senders))
+        t_post = time.perf_counter() - t0
+
+        # Laisse les derniers messages arriver
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline and any(len(d.received) < args.alerts for d in dashboards):
+            time.sleep(0.05)
+
+    delays = np.array([(t - sent_at[seq]) * 1000 for d in dashboards for seq, t in d.received.items()])
+    delivered = sum(len(d.received) for d in dashboards)
+    expected = args.clients * args.alerts
+    history = app.store.query(limit=args.alerts)
+    server.shutdown()
+
+    print(f"Ingestion      : {args.alerts} alertes en {t_post:.2f} s ({args.alerts / t_post:.0f} alertes/s)")
+    print(f"Historique     : {len(history)} alertes en base")
+    print(f"Livraison SSE  : {delivered}/{expected} ({delivered / expected * 100:.1f}%)")
+    if len(delays):
+        print(f"Délai réception: p50 {np.percentile(delays, 50):.1f} ms, p99 {np.percentile(delays, 99):.1f} ms, "
+              f"max {delays.max():.1f} ms")
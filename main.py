@@ -1,11 +1,18 @@
 import os
+import time
+import argparse
+import threading
+import dataclasses
 import cv2
 import numpy as np
-import requests
-import pygame
 import matplotlib.pyplot as plt
-from collections import deque
 import config as cfg
+from alerts import AlertDispatcher
+from metrics import MetricsRecorder, plot_series
+import telemetry
+from detector import upright_image, upright_point
+from sources import open_source
+from clips import open_recorder
 
 # =========================================
 #   SELECTION INTERACTIVE DE LA VIDEO
@@ -44,225 +51,266 @@ def select_video():
         except ValueError:
             print("❌ Veuillez entrer un nombre entier.")
 
-# Appel de la fonction de sélection
-VIDEO_PATH = select_video()
-
-if VIDEO_PATH is None:
-    print("Au revoir !")
-    exit() # Arrête le script proprement
-
-print(f"\n✅ Lancement de : {os.path.basename(VIDEO_PATH)}")
-
 # =========================================
-#   INITIALISATION AUDIO / VIDEO
+#        BOUCLE PRINCIPALE
 # =========================================
 
-try:
-    pygame.mixer.init()
-except Exception as e:
-    print(f"⚠️ Erreur init audio : {e}")
+def build_display_frame(frame, res, detector):
+    """
+    Image à afficher, remise debout (seule rotation du pipeline).
+    La nuit on montre l'image pré-traitée, recollée sur la zone analysée.
+    """
+    if frame.ndim == 2:
+        # Frame déjà grise et réduite par le décodeur : remise à la taille native
+        frame = cv2.cvtColor(cv2.resize(frame, detector.source_size), cv2.COLOR_GRAY2BGR)
+    if res.is_night and res.gray_active is not None:
+        x0, y0, x1, y1 = detector.roi_rect
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray[y0:y1, x0:x1] = cv2.resize(res.gray_active, (x1 - x0, y1 - y0))
+        frame = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    height, width = frame.shape[:2]
+    display_frame = upright_image(frame, cfg.ORIENTATION)
+    if display_frame is frame:
+        display_frame = frame.copy()  # La frame source part aussi dans le tampon des clips
+
+    if detector.bed_roi:
+        pts = [upright_point(px * width, py * height, width, height, cfg.ORIENTATION) for px, py in detector.bed_roi]
+        cv2.polylines(display_frame, [np.array(pts, np.int32)], True, (255, 200, 0), 2)
+    return display_frame
+
+
+def draw_hud(display_frame, res, fall_frame_info, fall_detected):
+    """Dessine la boite et le panneau d'infos, retourne l'image redimensionnée."""
+    mode_text, color_mode = ("MODE NUIT", (0, 165, 255)) if res.is_night else ("MODE JOUR", (0, 255, 0))
+    posture_text = "---"
 
-cap = cv2.VideoCapture(VIDEO_PATH)
-if not cap.isOpened():
-    print("❌ Impossible d'ouvrir la vidéo.")
-    exit()
+    if res.bbox is not None:
+        x, y, w, h = res.bbox
+        posture_text = "COUCHE" if res.is_horizontal else "DEBOUT"
+        color_rect = (0, 0, 255) if res.is_horizontal else (0, 255, 0)
+        cv2.rectangle(display_frame, (x, y), (x + w, y + h), color_rect, 2)
+        cv2.circle(display_frame, (res.x_center, res.y_smooth), 8, (0, 0, 255), -1)
 
-fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-display_delay = max(1, int(1000 / fps))
+    height, width = display_frame.shape[:2]
+    resized_frame = cv2.resize(display_frame, (int(width * cfg.WINDOW_SCALE), int(height * cfg.WINDOW_SCALE)))
 
-# =========================================
-#   FONCTION LOCALES
-# =========================================
+    # Panneau assombri (60 % de noir) : seule sa zone est touchée
+    panel = resized_frame[:231, :321]  # Coin (320, 230) inclus, comme cv2.rectangle
+    cv2.addWeighted(panel, 0.4, panel, 0, 0, panel)
 
-def apply_light_condition(gray, brightness):
-    """
-    Retourne les paramètres et aussi les INFOS D'AFFICHAGE (Textes, Couleurs)
-    """
-    if brightness < cfg.DARKNESS_THRESHOLD:
-        gray_proc = cv2.GaussianBlur(gray, cfg.NIGHT_BLUR, 0)
-        clahe = cv2.createCLAHE(clipLimit=cfg.NIGHT_CLAHE, tileGridSize=(8, 8))
-        gray_proc = clahe.apply(gray_proc)
-        return (gray_proc, "MODE NUIT", (0, 165, 255), cfg.NIGHT_THRESHOLD, cfg.NIGHT_MIN_AREA, cfg.DY_NIGHT_THRESHOLD)
-    else:
-        gray_proc = cv2.GaussianBlur(gray, cfg.DAY_BLUR, 0)
-        return (gray_proc, "MODE JOUR", (0, 255, 0), cfg.DAY_THRESHOLD, cfg.DAY_MIN_AREA, cfg.DY_DAY_THRESHOLD)
+    font = cv2.FONT_HERSHEY_SIMPLEX
 
-# =========================================
-#        BOUCLE PRINCIPALE
-# =========================================
+    cv2.putText(resized_frame, f"Frame: {res.frame_idx + 1}", (10, 30), font, 0.6, (255, 255, 255), 1)
+    cv2.putText(resized_frame, f"{mode_text} (Lum: {res.brightness:.0f})", (10, 60), font, 0.6, color_mode, 2)
 
-prev_gray = None
-frame_idx = 0
-fall_detected = False
-fall_frame_info = "Aucune chute"
-fall_detected_frame = None
+    current_dy = res.dy
+    dy_threshold_mode = res.dy_threshold
+    if current_dy > cfg.MAX_DY:
+        color_dy = (0, 0, 255) ; txt_dy = f"dy: {current_dy} (IGNORED)"
+    elif current_dy > dy_threshold_mode:
+        color_dy = (0, 165, 255) ; txt_dy = f"dy: {current_dy} (> {dy_threshold_mode})"
+    else:
+        color_dy = (0, 255, 0) ; txt_dy = f"dy: {current_dy} (Seuil {dy_threshold_mode})"
+    cv2.putText(resized_frame, txt_dy, (10, 90), font, 0.6, color_dy, 2)
 
-y_history = deque(maxlen=cfg.ANALYSIS_STRIDE + 1)
-y_buffer_smooth = deque(maxlen=cfg.SMOOTHING_WINDOW)
+    color_area = (0, 255, 255) if res.area > res.min_area else (150, 150, 150)
+    cv2.putText(resized_frame, f"Area: {int(res.area)}", (10, 120), font, 0.6, color_area, 1)
+    cv2.putText(resized_frame, f"Min Area: {res.min_area}", (10, 140), font, 0.5, color_area, 1)
 
-fall_counter = 0
-current_dy = 0
-posture_text = "---"
+    color_pos = (0, 0, 255) if posture_text == "COUCHE" else (0, 255, 0)
+    cv2.putText(resized_frame, f"Pos: {posture_text}", (10, 170), font, 0.6, color_pos, 2)
 
-# Data pour le graph final
-data_frames, data_dy, data_brightness, data_area = [], [], [], []
+    color_alert = (255, 255, 255) if not fall_detected else (0, 0, 255)
+    cv2.putText(resized_frame, fall_frame_info, (10, 210), font, 0.7, color_alert, 2)
+    return resized_frame
 
-print("--- Analyse Hybride (Interface Complète) ---")
 
-while True:
-    ret, frame = cap.read()
-    if not ret: break
-    
-    area = 0 
-    posture_text = "---"
-    
-    if cfg.ROTATE_VIDEO:
-        frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-    gray_raw = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    avg_brightness = np.mean(gray_raw)
-
-    (gray_active, 
-     mode_text, 
-     color_mode, 
-     threshold_pixel, 
-     min_area_mode, 
-     dy_threshold_mode) = apply_light_condition(gray_raw, avg_brightness)
-
-    display_frame = cv2.cvtColor(gray_active, cv2.COLOR_GRAY2BGR) if mode_text == "MODE NUIT" else frame
-
-    if prev_gray is not None:
-        diff = cv2.absdiff(gray_active, prev_gray)
-        _, motion_mask = cv2.threshold(diff, threshold_pixel, 255, cv2.THRESH_BINARY)
-        kernel = np.ones((5, 5), np.uint8)
-        motion_mask = cv2.morphologyEx(motion_mask, cv2.MORPH_OPEN, kernel)
-        moments = cv2.moments(motion_mask)
-        area = moments["m00"]
-
-        if area > min_area_mode:
-            y_raw = int(moments["m01"] / moments["m00"])
-            x_center = int(moments["m10"] / moments["m00"])
-            
-            y_buffer_smooth.append(y_raw)
-            y_smooth = int(sum(y_buffer_smooth) / len(y_buffer_smooth))
-            
-            x, y, w, h = cv2.boundingRect(motion_mask)
-            is_horizontal = w*1.2 >= h 
-            posture_text = "COUCHE" if is_horizontal else "DEBOUT"
-            
-            if cfg.DISPLAY_VIDEO:
-                color_rect = (0, 0, 255) if is_horizontal else (0, 255, 0)
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), color_rect, 2)
-                cv2.circle(display_frame, (x_center, y_smooth), 8, (0, 0, 255), -1) 
-
-            y_history.append(y_smooth)
-
-            if len(y_history) > cfg.ANALYSIS_STRIDE:
-                current_dy = y_history[-1] - y_history[0]
-                if abs(y_history[-1] - y_history[-2]) < 3: current_dy = 0
-
-                if (current_dy > dy_threshold_mode) and (current_dy < cfg.MAX_DY) and is_horizontal:
-                    fall_counter += 1
-                else:
-                    if fall_counter > 0: fall_counter -= 1
-
-                if (not fall_detected) and fall_counter >= cfg.CONSECUTIVE_VALIDATIONS:
-                    fall_detected = True
-                    fall_detected_frame = frame_idx
-                    fall_frame_info = f"CHUTE: Frame {frame_idx}"
-                    print(f"\n🚨 CHUTE VALIDÉE (Frame {frame_idx})")
-                    try:
-                        pygame.mixer.music.load(cfg.ALERT_MP3_PATH)
-                        pygame.mixer.music.play()
-                        requests.post(cfg.ALERT_API_URL, json={"frame": frame_idx, "source": VIDEO_PATH}, timeout=1)
-                    except: pass
-        else:
-            if len(y_history) > 0: y_history.popleft()
-            y_buffer_smooth.clear()
-            fall_counter = 0
-            current_dy = 0
-
-    prev_gray = gray_active.copy()
-    
-    data_frames.append(frame_idx)
-    data_dy.append(current_dy)
-    data_brightness.append(avg_brightness)
-    data_area.append(area)
-    
-    frame_idx += 1
-
-    if cfg.DISPLAY_VIDEO:
-        height, width = display_frame.shape[:2]
-        resized_frame = cv2.resize(display_frame, (int(width * cfg.WINDOW_SCALE), int(height * cfg.WINDOW_SCALE)))
-        
-        overlay = resized_frame.copy()
-        cv2.rectangle(overlay, (0, 0), (320, 230), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.6, resized_frame, 0.4, 0, resized_frame)
-        
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        
-        cv2.putText(resized_frame, f"Frame: {frame_idx}", (10, 30), font, 0.6, (255, 255, 255), 1)
-        cv2.putText(resized_frame, f"{mode_text} (Lum: {avg_brightness:.0f})", (10, 60), font, 0.6, color_mode, 2)
-        
-        if current_dy > cfg.MAX_DY:
-            color_dy = (0, 0, 255) ; txt_dy = f"dy: {current_dy} (IGNORED)"
-        elif current_dy > dy_threshold_mode:
-            color_dy = (0, 165, 255) ; txt_dy = f"dy: {current_dy} (> {dy_threshold_mode})"
-        else:
-            color_dy = (0, 255, 0) ; txt_dy = f"dy: {current_dy} (Seuil {dy_threshold_mode})"
-        cv2.putText(resized_frame, txt_dy, (10, 90), font, 0.6, color_dy, 2)
-
-        color_area = (0, 255, 255) if area > min_area_mode else (150, 150, 150)
-        cv2.putText(resized_frame, f"Area: {int(area)}", (10, 120), font, 0.6, color_area, 1)
-        cv2.putText(resized_frame, f"Min Area: {min_area_mode}", (10, 140), font, 0.5, color_area, 1)
-
-        color_pos = (0, 0, 255) if posture_text == "COUCHE" else (0, 255, 0)
-        cv2.putText(resized_frame, f"Pos: {posture_text}", (10, 170), font, 0.6, color_pos, 2)
-
-        color_alert = (255, 255, 255) if not fall_detected else (0, 0, 255)
-        cv2.putText(resized_frame, fall_frame_info, (10, 210), font, 0.7, color_alert, 2)
-
-        cv2.imshow("FallCall", resized_frame)
-        if cv2.waitKey(display_delay) & 0xFF == ord("q"):
-            break
-
-cap.release()
-cv2.destroyAllWindows()
+class Preview:
+    """
+    Affichage découplé de l'analyse : le thread principal (seul à pouvoir gérer les
+    fenêtres sur certains OS) redessine au plus PREVIEW_FPS fois par seconde le dernier
+    état que lui a passé le thread d'analyse. L'analyse ne dessine ni n'attend rien.
+    """
+
+    def __init__(self, detector, fps=cfg.PREVIEW_FPS):
+        self.detector = detector
+        self.period = 1.0 / fps
+        self._want = threading.Event()  # L'aperçu attend un nouvel état
+        self._lock = threading.Lock()
+        self._state = None
+
+    def offer(self, frame, res, fall_frame_info):
+        """Côté analyse : ne garde l'état que si l'aperçu en demande un (PREVIEW_FPS fois par seconde)."""
+        if not self._want.is_set(): return
+        self._want.clear()
+        if res.is_night and res.gray_active is not None:
+            # Buffer réutilisé par le détecteur dès la frame suivante
+            res = dataclasses.replace(res, gray_active=res.gray_active.copy())
+        with self._lock:
+            self._state = (frame, res, fall_frame_info, self.detector.fall_detected)
+
+    def run(self, worker):
+        """Côté thread principal : affiche jusqu'à la fin de `worker`. Retourne False si 'q' a été pressé."""
+        self._want.set()
+        try:
+            while worker.is_alive():
+                t0 = time.perf_counter()
+                with self._lock:
+                    state, self._state = self._state, None
+                if state is not None:
+                    frame, res, fall_frame_info, fall_detected = state
+                    display_frame = build_display_frame(frame, res, self.detector)
+                    cv2.imshow("FallCall", draw_hud(display_frame, res, fall_frame_info, fall_detected))
+                    self._want.set()
+                wait_ms = max(1, int((self.period - (time.perf_counter() - t0)) * 1000))
+                if cv2.waitKey(wait_ms) & 0xFF == ord("q"):
+                    return False
+            return True
+        finally:
+            cv2.destroyAllWindows()
+
+
+def run(video_path, display=cfg.DISPLAY_VIDEO, realtime=True):
+    """
+    `display` : fenêtre d'aperçu (rafraîchie à PREVIEW_FPS, hors du thread d'analyse) ;
+    `realtime` : fichier relu au rythme de son fps, sinon aussi vite que possible
+    (mêmes résultats de détection).
+    """
+    print(f"\n✅ Lancement de : {os.path.basename(video_path)}")
+
+    # =========================================
+    #   INITIALISATION AUDIO / VIDEO
+    # =========================================
+
+    src, detector = open_source(video_path)
+    if not src.isOpened():
+        print("❌ Impossible d'ouvrir la vidéo.")
+        return
+
+    # Son préchargé ici ; l'envoi se fait dans le thread du dispatcher
+    alerts = AlertDispatcher()
+    source_fps = src.fps
+
+    # Métriques pour le graph final, en mémoire bornée (flux continus compris)
+    name = os.path.splitext(os.path.basename(str(video_path)))[0]
+    metrics = MetricsRecorder(os.path.join(cfg.METRICS_DIR, name))
+    # Dernières secondes compressées, pour le clip joint à l'alerte
+    clips = open_recorder(name, src)
+
+    # Métriques Prometheus : mêmes séries que server.py, sans l'écran
+    labels = {"camera": name}
+    process_hist = telemetry.Histogram()
+    state = {"processed": 0, "last": None}
+    telemetry.REGISTRY.register(lambda: [
+        telemetry.Metric("fallcall_frames_processed_total", "counter", "Frames analysées").add(labels, state["processed"]),
+        telemetry.Metric("fallcall_process_seconds", "histogram",
+                         "Durée de FallDetector.process() par frame").add(labels, process_hist),
+    ] + telemetry.frame_metrics(labels, state["last"]) + telemetry.alert_metrics(alerts)
+      + telemetry.clip_metrics(labels, clips))
+    telemetry.start_http_server()
+
+    print("--- Analyse Hybride (Interface Complète) ---")
+    preview = Preview(detector) if display else None
+    stop = threading.Event()  # 'q' dans l'aperçu
+
+    def analyse():
+        fall_frame_info = "Aucune chute"
+        frame_period = src.period
+        next_time = time.perf_counter()
+
+        for frame_idx, frame in src.read():
+            if stop.is_set(): break
+            clips.add_frame(frame_idx, frame)
+            t0 = time.perf_counter()
+            res = detector.process(frame, frame_idx)
+            process_hist.observe(time.perf_counter() - t0)
+            state["processed"] += 1
+            state["last"] = res
+
+            if res.fall_detected:
+                fall_frame_info = f"CHUTE: Frame {res.frame_idx}"
+                print(f"\n🚨 CHUTE VALIDÉE (Frame {res.frame_idx})")
+                alerts.dispatch(res.frame_idx, video_path, res.frame_idx / source_fps, clips.trigger(res.frame_idx))
+
+            metrics.record(res)
+            if preview is not None: preview.offer(frame, res, fall_frame_info)
+
+            if realtime:
+                next_time += frame_period
+                delay = next_time - time.perf_counter()
+                if delay > 0: time.sleep(delay)
+
+    worker = threading.Thread(target=analyse, name="analyse", daemon=True)
+    t_start = time.perf_counter()
+    worker.start()
+    if preview is not None and not preview.run(worker): stop.set()
+    worker.join()
+    elapsed = time.perf_counter() - t_start
+    print(f"⏱️ {state['processed']} frames analysées en {elapsed:.1f}s ({state['processed'] / max(elapsed, 1e-6):.0f} fps)")
+
+    src.release()
+    clips.close()
+    alerts.close()
+    metrics.close()
+
+    save_graph(video_path, metrics, detector.fall_frame)
 
 # =========================================
 #       GENERATION DU GRAPHIQUE
 # =========================================
-print("📊 Génération du graphique...")
-os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
 
-if len(data_frames) > 0:
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12), sharex=True)
-    
-    ax1.plot(data_frames, data_dy, label="Vitesse (dy)", color="blue")
-    ax1.axhline(y=cfg.DY_DAY_THRESHOLD, color='green', linestyle='--', label="Seuil Jour")
-    ax1.axhline(y=cfg.DY_NIGHT_THRESHOLD, color='orange', linestyle='--', label="Seuil Nuit")
-    ax1.set_ylabel("Vitesse (px/s)")
-    if fall_detected_frame:
-        ax1.axvline(x=fall_detected_frame, color='red', linewidth=2, label="Chute")
-    ax1.legend()
-    ax1.grid(True)
-
-    ax2.plot(data_frames, data_area, label="Surface", color="purple")
-    ax2.axhline(y=cfg.DAY_MIN_AREA, color='green', linestyle='--')
-    ax2.axhline(y=cfg.NIGHT_MIN_AREA, color='orange', linestyle='--')
-    ax2.set_ylabel("Pixels²")
-    ax2.grid(True)
-
-    ax3.plot(data_frames, data_brightness, label="Luminosité", color="gold")
-    ax3.axhline(y=cfg.DARKNESS_THRESHOLD, color='black', linestyle='--')
-    ax3.fill_between(data_frames, 0, cfg.DARKNESS_THRESHOLD, color='gray', alpha=0.2)
-    ax3.set_ylabel("Lum")
-    ax3.grid(True)
-
-    filename_clean = os.path.splitext(os.path.basename(VIDEO_PATH))[0]
-    graph_path = os.path.join(cfg.OUTPUT_DIR, f"{filename_clean}_analyse.png")
-    plt.savefig(graph_path)
-    plt.close()
-    print(f"✅ Graphique : {graph_path}")
-    try: os.startfile(graph_path)
-    except: pass
\ No newline at end of file
+def save_graph(video_path, metrics, fall_detected_frame):
+    """Graphique de toute la durée : pleine résolution, ou enveloppe min/max si le flux était long."""
+    print("📊 Génération du graphique...")
+    os.makedirs(cfg.OUTPUT_DIR, exist_ok=True)
+    data = metrics.plot_data()
+    data_frames = data["frame_idx"]
+
+    if len(data_frames) > 0:
+        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12), sharex=True)
+
+        plot_series(ax1, data, "dy", label="Vitesse (dy)", color="blue")
+        ax1.axhline(y=cfg.DY_DAY_THRESHOLD, color='green', linestyle='--', label="Seuil Jour")
+        ax1.axhline(y=cfg.DY_NIGHT_THRESHOLD, color='orange', linestyle='--', label="Seuil Nuit")
+        ax1.set_ylabel("Vitesse (px/s)")
+        if fall_detected_frame:
+            ax1.axvline(x=fall_detected_frame, color='red', linewidth=2, label="Chute")
+        ax1.legend()
+        ax1.grid(True)
+
+        plot_series(ax2, data, "area", label="Surface", color="purple")
+        ax2.axhline(y=cfg.DAY_MIN_AREA, color='green', linestyle='--')
+        ax2.axhline(y=cfg.NIGHT_MIN_AREA, color='orange', linestyle='--')
+        ax2.set_ylabel("Pixels²")
+        ax2.grid(True)
+
+        plot_series(ax3, data, "brightness", label="Luminosité", color="gold")
+        ax3.axhline(y=cfg.DARKNESS_THRESHOLD, color='black', linestyle='--')
+        ax3.fill_between(data_frames, 0, cfg.DARKNESS_THRESHOLD, color='gray', alpha=0.2)
+        ax3.set_ylabel("Lum")
+        ax3.grid(True)
+
+        filename_clean = os.path.splitext(os.path.basename(video_path))[0]
+        graph_path = os.path.join(cfg.OUTPUT_DIR, f"{filename_clean}_analyse.png")
+        plt.savefig(graph_path)
+        plt.close()
+        print(f"✅ Graphique : {graph_path}")
+        try: os.startfile(graph_path)
+        except: pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse d'une vidéo FallCall")
+    parser.add_argument("video", nargs="?", default=None, help="Vidéo à analyser (sinon choix dans VIDEOS_DIR)")
+    parser.add_argument("--no-display", action="store_true", help="Sans fenêtre d'aperçu (ignore DISPLAY_VIDEO)")
+    parser.add_argument("--fast", action="store_true", help="Relecture plus rapide que le temps réel")
+    args = parser.parse_args()
+
+    # Appel de la fonction de sélection
+    VIDEO_PATH = args.video or select_video()
+
+    if VIDEO_PATH is None:
+        print("Au revoir !")
+    else:
+        run(VIDEO_PATH, display=cfg.DISPLAY_VIDEO and not args.no_display, realtime=not args.fast)
@@ -0,0 +1,210 @@
+import os
+import sys
+import glob
+import numpy as np
+import config as cfg
+
+# =========================================
+#   ENREGISTREMENT DES METRIQUES PAR FRAME
+# =========================================
+#
+# Mémoire constante quelle que soit la durée du flux :
+#   - les dernières frames sont gardées dans des buffers circulaires typés (NumPy) ;
+#     à chaque tour complet, le buffer est écrit sur disque en colonnes (.npz),
+#     en ne gardant que les METRICS_MAX_FILES derniers fichiers ;
+#   - un résumé min/max par paquet de frames couvre toute la durée : quand il est
+#     plein, les paquets sont fusionnés deux à deux (résolution divisée par 2).
+#
+#   python metrics.py output/metrics/lit_1   -> graphique de toute la durée enregistrée
+
+FIELDS = (
+    ("frame_idx", np.int64),
+    ("brightness", np.float32),
+    ("dy", np.int32),
+    ("area", np.float64),
+    ("is_night", np.bool_),
+    ("fall_counter", np.int16),
+)
+SUMMARY_FIELDS = ("brightness", "dy", "area")
+
+
+class MetricsRecorder:
+    def __init__(self, out_dir=None, capacity=cfg.METRICS_BUFFER, summary_size=cfg.METRICS_SUMMARY_SIZE,
+                 bucket=cfg.METRICS_SUMMARY_BUCKET, max_files=cfg.METRICS_MAX_FILES):
+        """`out_dir` : dossier des fichiers colonnes (None = mémoire seulement)."""
+        self.out_dir = out_dir
+        self.capacity = capacity
+        self.max_files = max_files
+        self.ring = {name: np.zeros(capacity, dtype) for name, dtype in FIELDS}
+        self.pos = 0        # Prochaine case écrite
+        self.count = 0      # Frames enregistrées depuis le début
+
+        # Résumé : début (frame) + min / max de chaque paquet de `bucket` frames
+        self.bucket = bucket
+        self.summary_size = summary_size - summary_size % 2
+        self.s_start = np.zeros(self.summary_size, np.int64)
+        self.s_min = {f: np.zeros(self.summary_size) for f in SUMMARY_FIELDS}
+        self.s_max = {f: np.zeros(self.summary_size) for f in SUMMARY_FIELDS}
+        self.s_len = 0
+        self._acc = None    # Paquet en cours : [début, nb, {min}, {max}]
+
+        self.files = []
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            self.files = sorted(glob.glob(os.path.join(out_dir, "chunk-*.npz")))
+
+    def record(self, res):
+        """Ajoute un FrameResult."""
+        i = self.pos
+        r = self.ring
+        r["frame_idx"][i] = res.frame_idx
+        r["brightness"][i] = res.brightness
+        r["dy"][i] = res.dy
+        r["area"][i] = res.area
+        r["is_night"][i] = res.is_night
+        r["fall_counter"][i] = res.fall_counter
+        self._summarize(res.frame_idx, (res.brightness, res.dy, res.area))
+
+        self.count += 1
+        self.pos = (i + 1) % self.capacity
+        if self.pos == 0 and self.out_dir:
+            self.flush()
+
+    # -----------------------------------------
+    #   Résumé min / max
+    # -----------------------------------------
+
+    def _summarize(self, frame_idx, values):
+        acc = self._acc
+        if acc is None:
+            self._acc = [frame_idx, 1, list(values), list(values)]
+            return
+        acc[1] += 1
+        lo, hi = acc[2], acc[3]
+        for k, v in enumerate(values):
+            if v < lo[k]: lo[k] = v
+            if v > hi[k]: hi[k] = v
+        if acc[1] >= self.bucket:
+            self._push_bucket()
+
+    def _push_bucket(self):
+        start, _, lo, hi = self._acc
+        self._acc = None
+        if self.s_len == self.summary_size:
+            self._compact()
+        n = self.s_len
+        self.s_start[n] = start
+        for k, f in enumerate(SUMMARY_FIELDS):
+            self.s_min[f][n] = lo[k]
+            self.s_max[f][n] = hi[k]
+        self.s_len += 1
+
+    def _compact(self):
+        """Fusionne les paquets deux à deux : même mémoire, durée couverte doublée."""
+        half = self.summary_size // 2
+        self.s_start[:half] = self.s_start[0::2]
+        for f in SUMMARY_FIELDS:
+            np.minimum(self.s_min[f][0::2], self.s_min[f][1::2], out=self.s_min[f][:half])
+            np.maximum(self.s_max[f][0::2], self.s_max[f][1::2], out=self.s_max[f][:half])
+        self.s_len = half
+        self.bucket *= 2
+
+    def summary(self):
+        """{"frame_idx": débuts de paquets, "<champ>_min"/"<champ>_max": enveloppes} (paquet en cours inclus)."""
+        n = self.s_len
+        out = {"frame_idx": self.s_start[:n].copy(), "bucket": self.bucket}
+        for f in SUMMARY_FIELDS:
+            out[f"{f}_min"] = self.s_min[f][:n].copy()
+            out[f"{f}_max"] = self.s_max[f][:n].copy()
+        if self._acc is not None:
+            start, _, lo, hi = self._acc
+            out["frame_idx"] = np.append(out["frame_idx"], start)
+            for k, f in enumerate(SUMMARY_FIELDS):
+                out[f"{f}_min"] = np.append(out[f"{f}_min"], lo[k])
+                out[f"{f}_max"] = np.append(out[f"{f}_max"], hi[k])
+        return out
+
+    # -----------------------------------------
+    #   Lecture / écriture
+    # -----------------------------------------
+
+    def recent(self):
+        """Les dernières frames (au plus `capacity`), dans l'ordre chronologique."""
+        if self.count < self.capacity:
+            return {name: arr[:self.pos].copy() for name, arr in self.ring.items()}
+        return {name: np.concatenate((arr[self.pos:], arr[:self.pos])) for name, arr in self.ring.items()}
+
+    def plot_data(self):
+        """
+        Séries à tracer : pleine résolution si tout tient dans le buffer,
+        sinon l'enveloppe min/max du résumé. Retourne {"frame_idx", "<champ>_min", "<champ>_max"}.
+        """
+        if self.count > self.capacity:
+            return self.summary()
+        data = self.recent()
+        out = {"frame_idx": data["frame_idx"]}
+        for f in SUMMARY_FIELDS:
+            out[f"{f}_min"] = out[f"{f}_max"] = data[f]
+        return out
+
+    def flush(self):
+        """Ecrit les frames pas encore sauvegardées (depuis le dernier tour) et le résumé."""
+        n = self.pos or (self.capacity if self.count else 0)
+        if not self.out_dir or n == 0:
+            return
+        seq = int(os.path.basename(self.files[-1])[6:-4]) + 1 if self.files else 0
+        path = os.path.join(self.out_dir, f"chunk-{seq:06d}.npz")
+        np.savez(path, **{name: arr[:n] for name, arr in self.ring.items()})
+        self.files.append(path)
+        while len(self.files) > self.max_files:
+            try: os.remove(self.files.pop(0))
+            except OSError: pass
+        self.save_summary()
+
+    def save_summary(self):
+        path = os.path.join(self.out_dir, "summary.npz")
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, **self.summary())
+        os.replace(tmp, path)
+
+    def close(self):
+        """Sauvegarde les frames du tour en cours (flux arrêté / fin de vidéo)."""
+        if self.out_dir and self.pos:
+            self.flush()
+
+
+def plot_series(ax, data, field, **kwargs):
+    """Trace une série de plot_data() : ligne si pleine résolution, bande min/max sinon."""
+    frames, lo, hi = data["frame_idx"], data[f"{field}_min"], data[f"{field}_max"]
+    if lo is hi:
+        ax.plot(frames, hi, **kwargs)
+    else:
+        ax.fill_between(frames, lo, hi, step="post", alpha=0.6, linewidth=0.5, **kwargs)
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    for metrics_dir in sys.argv[1:]:
+        with np.load(os.path.join(metrics_dir, "summary.npz")) as f:
+            data = {k: f[k] for k in f.files}
+        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+        fig.suptitle(f"{os.path.basename(os.path.normpath(metrics_dir))} "
+                     f"({len(data['frame_idx'])} points, {int(data['bucket'])} frames/point)")
+        plot_series(ax1, data, "dy", color="blue")
+        ax1.axhline(y=cfg.DY_DAY_THRESHOLD, color='green', linestyle='--', alpha=0.5)
+        ax1.axhline(y=cfg.DY_NIGHT_THRESHOLD, color='orange', linestyle='--', alpha=0.5)
+        ax1.set_ylabel("Vitesse")
+        plot_series(ax2, data, "area", color="purple")
+        ax2.set_ylabel("Pixels²")
+        ax2.set_yscale('symlog')
+        plot_series(ax3, data, "brightness", color="gold")
+        ax3.axhline(y=cfg.DARKNESS_THRESHOLD, color='black', linestyle='--')
+        ax3.set_ylabel("Lum")
+        ax3.set_xlabel("Frames")
+        for ax in (ax1, ax2, ax3): ax.grid(True, alpha=0.3)
+
+        out_path = os.path.join(metrics_dir, "summary.png")
+        plt.savefig(out_path)
+        plt.close()
+        print(f"✅ {out_path}")
@@ -0,0 +1,529 @@
+import os
+import sys
+import time
+import queue
+import signal
+import functools
+import threading
+import multiprocessing
+import cv2
+import numpy as np
+import config as cfg
+from alerts import AlertDispatcher
+from metrics import MetricsRecorder
+import telemetry
+from telemetry import Histogram, SharedHistogram, SharedState, Metric
+from sources import open_source
+from clips import ClipRecorder, open_recorder
+from detector import FallDetector, seconds_to_frames
+from framebus import FrameBus
+
+# =========================================
+#   SERVEUR MULTI-CAMERAS (SANS AFFICHAGE)
+# =========================================
+#
+# Un seul process, N flux : pour chaque caméra un thread lit/décode
+# (OpenCV relâche le GIL pendant le décodage) et un thread analyse.
+# Entre les deux, une file bornée : si l'analyse prend du retard, on jette
+# les frames les plus anciennes au lieu d'accumuler de la latence.
+
+def rearming(detector):
+    """Flux 24/7 : le détecteur est réarmé FALL_REARM_SEC après chaque chute validée."""
+    if cfg.FALL_REARM_SEC:
+        detector.rearm_after = seconds_to_frames(cfg.FALL_REARM_SEC, detector.fps)
+    return detector
+
+
+class CameraStream:
+    def __init__(self, name, source, alerts=None, queue_size=cfg.FRAME_QUEUE_SIZE):
+        self.name = name
+        self.source = source
+        self.alerts = alerts
+        self.metrics = MetricsRecorder(os.path.join(cfg.METRICS_DIR, name))
+        # Un fichier est relu au rythme de son fps pour simuler une caméra
+        self.is_file = isinstance(source, str) and os.path.exists(source)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.detector = None  # Créé à l'ouverture, une fois le fps de la source connu
+        self.clips = None     # Idem (clip avant / après chute joint aux alertes)
+        self.source_fps = None
+        self.running = False
+        self.threads = []
+
+        self._lock = threading.Lock()
+        self.total_processed = 0
+        self.total_dropped = 0
+        self._reset_window()
+
+        # Télémétrie : seuls les histogrammes sont mis à jour par frame
+        self.last_result = None
+        self.latency_hist = Histogram()   # Décodage -> résultat (file d'attente comprise)
+        self.process_hist = Histogram()   # FallDetector.process() seul
+
+    def _reset_window(self):
+        self.win_start = time.perf_counter()
+        self.win_processed = 0
+        self.win_dropped = 0
+        self.win_latency_sum = 0.0
+        self.win_latency_max = 0.0
+
+    # -----------------------------------------
+    #   Cycle de vie
+    # -----------------------------------------
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self._reader, name=f"{self.name}-decode", daemon=True),
+            threading.Thread(target=self._worker, name=f"{self.name}-detect", daemon=True),
+        ]
+        for t in self.threads: t.start()
+
+    def stop(self):
+        self.running = False
+
+    def join(self, timeout=None):
+        for t in self.threads: t.join(timeout)
+
+    def is_alive(self):
+        return any(t.is_alive() for t in self.threads)
+
+    # -----------------------------------------
+    #   Threads
+    # -----------------------------------------
+
+    def _push(self, item):
+        """Ajoute dans la file bornée en jetant la frame la plus ancienne si elle est pleine."""
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    with self._lock:
+                        self.total_dropped += 1
+                        self.win_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _reader(self):
+        while self.running:
+            # Pas de prefetch : ce thread est déjà le thread de lecture du flux
+            src, detector = open_source(self.source, prefetch=0)
+            if self.detector is None: self.detector = rearming(detector)
+            if not src.isOpened():
+                print(f"❌ [{self.name}] Impossible d'ouvrir {self.source}")
+                if self.is_file: break
+                time.sleep(2.0)
+                continue
+
+            if self.clips is None: self.clips = open_recorder(self.name, src)
+            else: self.clips.attach(src)
+
+            frame_period = src.period
+            self.source_fps = src.fps
+            next_time = time.perf_counter()
+
+            for frame_idx, frame in src.read():
+                if not self.running: break
+                self.clips.add_frame(frame_idx, frame)
+                self._push((frame_idx, frame, time.perf_counter()))
+
+                if self.is_file:
+                    next_time += frame_period
+                    delay = next_time - time.perf_counter()
+                    if delay > 0: time.sleep(delay)
+
+            src.release()
+            if self.is_file: break
+            print(f"⚠️ [{self.name}] Flux interrompu, reconnexion...")
+            time.sleep(1.0)
+
+        self._push(None)  # Fin du flux
+
+    def _worker(self):
+        while True:
+            item = self.frames.get()
+            if item is None: break
+            frame_idx, frame, t_decoded = item
+
+            t0 = time.perf_counter()
+            res = self.detector.process(frame, frame_idx)
+            t1 = time.perf_counter()
+            latency = t1 - t_decoded
+            self.metrics.record(res)
+            self.process_hist.observe(t1 - t0)
+            self.latency_hist.observe(latency)
+            self.last_result = res
+
+            with self._lock:
+                self.total_processed += 1
+                self.win_processed += 1
+                self.win_latency_sum += latency
+                self.win_latency_max = max(self.win_latency_max, latency)
+
+            if res.fall_detected:
+                print(f"\n🚨 [{self.name}] CHUTE VALIDÉE (Frame {res.frame_idx})")
+                if self.alerts is not None:
+                    clip = self.clips.trigger(res.frame_idx) if self.clips is not None else None
+                    self.alerts.dispatch(res.frame_idx, self.name, res.frame_idx / self.source_fps, clip)
+
+        self.metrics.close()
+        if self.clips is not None: self.clips.close()
+        self.running = False
+
+    # -----------------------------------------
+    #   Statistiques
+    # -----------------------------------------
+
+    def stats(self):
+        """Retourne fps / latence sur la fenêtre écoulée puis la réinitialise."""
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.win_start, 1e-6)
+            n = self.win_processed
+            s = {
+                "name": self.name,
+                "fps": n / elapsed,
+                "latency_avg_ms": (self.win_latency_sum / n * 1000) if n else 0.0,
+                "latency_max_ms": self.win_latency_max * 1000,
+                "dropped": self.win_dropped,
+                "queued": self.frames.qsize(),
+                "total_processed": self.total_processed,
+                "total_dropped": self.total_dropped,
+            }
+            self._reset_window()
+        return s
+
+
+    def collect(self):
+        """Métriques Prometheus du flux (lues au moment de la requête /metrics)."""
+        labels = {"camera": self.name}
+        return [
+            Metric("fallcall_frames_processed_total", "counter", "Frames analysées").add(labels, self.total_processed),
+            Metric("fallcall_frames_dropped_total", "counter",
+                   "Frames jetées car l'analyse était en retard").add(labels, self.total_dropped),
+            Metric("fallcall_queue_depth", "gauge", "Frames en attente d'analyse").add(labels, self.frames.qsize()),
+            Metric("fallcall_stream_up", "gauge", "1 si le flux est actif").add(labels, self.is_alive()),
+            Metric("fallcall_frame_latency_seconds", "histogram",
+                   "Délai entre décodage et résultat d'une frame").add(labels, self.latency_hist),
+            Metric("fallcall_process_seconds", "histogram",
+                   "Durée de FallDetector.process() par frame").add(labels, self.process_hist),
+        ] + telemetry.frame_metrics(labels, self.last_result) + telemetry.clip_metrics(labels, self.clips)
+
+
+# =========================================
+#   MODE MULTI-PROCESS (BUS DE FRAMES PARTAGE)
+# =========================================
+#
+# server.py --processes : par caméra, un process décode et publie chaque frame
+# une seule fois dans un FrameBus (mémoire partagée) ; un process d'analyse la lit
+# sans pickle, détection et clips ayant chacun leur curseur. --preview ajoute une
+# fenêtre d'aperçu, simple lecteur de plus. L'analyse de N caméras occupe N cœurs
+# au lieu de se partager le GIL ; les chutes remontent au process principal
+# (un seul dispatcher d'alertes). Compteurs, histogrammes et jauges de /metrics
+# (dernière frame, clips) sont écrits en mémoire partagée par l'analyse.
+
+READER_DETECT, READER_CLIPS, READER_PREVIEW = 0, 1, 2
+
+
+def _child_init():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C géré par le process principal
+
+
+def _decode_process(name, source, is_file, info, stop):
+    """Décode `source` dans un bus ; envoie (spec, fps, step, taille) sur `info` à la première frame."""
+    _child_init()
+    bus = None
+    try:
+        while not stop.is_set():
+            src, detector = open_source(source, prefetch=0)
+            if not src.isOpened():
+                print(f"❌ [{name}] Impossible d'ouvrir {source}")
+                if is_file: break
+                time.sleep(2.0)
+                continue
+
+            frame_period = src.period
+            next_time = time.perf_counter()
+            for frame_idx, frame in src.read():
+                if stop.is_set(): break
+                if bus is None:
+                    bus = FrameBus.create(frame.shape, frame.dtype)
+                    info.put((bus.spec, src.fps, src.step, src.size))
+                bus.publish(frame, frame_idx)
+
+                if is_file:
+                    next_time += frame_period
+                    delay = next_time - time.perf_counter()
+                    if delay > 0: time.sleep(delay)
+
+            src.release()
+            if is_file: break
+            print(f"⚠️ [{name}] Flux interrompu, reconnexion...")
+            time.sleep(1.0)
+    finally:
+        if bus is None:
+            info.put(None)
+        else:
+            bus.end()
+            stop.wait()  # Segment gardé jusqu'à ce que les lecteurs aient fini
+            bus.close()
+
+
+def _feed_clips(bus, clips):
+    """Lecteur du bus pour les clips : toujours la frame la plus récente, compressée sans copie."""
+    reader = bus.reader(READER_CLIPS, max_lag=1)
+    for seq, frame_idx, _, frame in reader:
+        clips.add_frame(frame_idx, frame, functools.partial(reader.valid, seq))
+
+
+def _analysis_process(name, spec, fps, step, size, events, counters, latency_hist, process_hist, shared):
+    """
+    Détection sur les frames du bus ; chaque chute est envoyée sur `events`.
+    `shared` : (état de la dernière frame, état des clips, histogramme d'écriture des clips),
+    relus par le parent pour /metrics.
+    """
+    frame_state, clip_state, clip_hist = shared
+    _child_init()
+    bus = FrameBus.attach(spec)
+    detector = FallDetector(fps=fps / step, scale=cfg.ANALYSIS_SCALE)
+    detector.source_size = size
+    rearming(detector)
+    metrics = MetricsRecorder(os.path.join(cfg.METRICS_DIR, name))
+    clips = ClipRecorder(name, fps, write_hist=clip_hist)
+    clip_thread = threading.Thread(target=_feed_clips, args=(bus, clips), name=f"{name}-clip-read", daemon=True)
+    clip_thread.start()
+
+    # Une frame BGR est analysée directement dans le bus : le détecteur n'en garde que
+    # le gris réduit (ses propres buffers). Si la case a été réécrite pendant l'analyse,
+    # le résultat est jeté et la différence repart de zéro. Une frame grise (décodeur
+    # qui réduit) devient prev_raw telle quelle : celle-là, petite, est copiée hors du
+    # bus, dans deux buffers en alternance
+    reader = bus.reader(READER_DETECT)
+    frame = spare = None
+    for seq, frame_idx, t_decoded, view in reader:
+        if view.ndim == 2:
+            if spare is None or spare.shape != view.shape: spare = np.empty_like(view)
+            if not reader.copy(seq, view, spare): continue
+            frame, spare = spare, frame
+        else:
+            frame = view
+        t0 = time.perf_counter()
+        res = detector.process(frame, frame_idx)
+        t1 = time.perf_counter()
+        if frame is view and not reader.release(seq):
+            detector.prev_gray = detector.prev_raw = None
+            # Une chute validée ici l'a été sur les frames précédentes : l'alerte part quand même
+            if not res.fall_detected: continue
+        latency = t1 - t_decoded
+        metrics.record(res)
+        process_hist.observe(t1 - t0)
+        latency_hist.observe(latency)
+        frame_state.update(res)
+        clip_state.update(clips)
+        counters[0] += 1
+        counters[1] += latency
+        counters[2] = max(counters[2], latency)
+
+        if res.fall_detected:
+            print(f"\n🚨 [{name}] CHUTE VALIDÉE (Frame {res.frame_idx})")
+            events.put((res.frame_idx, res.frame_idx / fps, clips.trigger(res.frame_idx)))
+
+    clip_thread.join()
+    clips.close()
+    clip_state.update(clips)  # Clips écrits à la fermeture
+    metrics.close()
+    bus.close()
+
+
+def _preview_process(name, spec):
+    """Fenêtre d'aperçu du flux brut ; 'q' la ferme sans arrêter l'analyse."""
+    _child_init()
+    bus = FrameBus.attach(spec)
+    for _, _, _, frame in bus.reader(READER_PREVIEW, max_lag=1):
+        height, width = frame.shape[:2]
+        cv2.imshow(f"FallCall - {name}", cv2.resize(frame, (int(width * cfg.WINDOW_SCALE), int(height * cfg.WINDOW_SCALE))))
+        if cv2.waitKey(1) & 0xFF == ord("q"): break
+    cv2.destroyAllWindows()
+    bus.close()
+
+
+class BusStream:
+    """Même interface que CameraStream ; décodage et analyse dans des process séparés."""
+
+    _ctx = multiprocessing.get_context("spawn")  # Pas de fork d'un process avec des threads
+
+    def __init__(self, name, source, alerts=None, preview=False):
+        self.name = name
+        self.source = source
+        self.alerts = alerts
+        self.preview = preview
+        self.is_file = isinstance(source, str) and os.path.exists(source)
+        self.source_fps = None
+        self.bus = None
+        self.procs = []
+        self.thread = None
+
+        ctx = self._ctx
+        self.stop_event = ctx.Event()
+        self.info = ctx.Queue()
+        self.events = ctx.Queue()
+        self.counters = ctx.RawArray("d", 3)  # Frames analysées, somme des latences, latence max (fenêtre)
+        self.latency_hist = SharedHistogram()
+        self.process_hist = SharedHistogram()
+        self.frame_state = SharedState(telemetry.FRAME_FIELDS)  # Dernier FrameResult (jauges /metrics)
+        self.clip_state = SharedState(telemetry.CLIP_FIELDS)
+        self.clip_hist = SharedHistogram()
+        self._last = (0, 0.0, 0)              # Totaux au dernier rapport (frames, latences, jetées)
+        self.win_start = time.perf_counter()
+
+    # -----------------------------------------
+    #   Cycle de vie
+    # -----------------------------------------
+
+    def start(self):
+        decoder = self._ctx.Process(target=_decode_process, name=f"{self.name}-decode",
+                                    args=(self.name, self.source, self.is_file, self.info, self.stop_event))
+        decoder.start()
+        self.procs = [decoder]
+        self.thread = threading.Thread(target=self._supervise, name=f"{self.name}-bus", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        if self.thread is not None: self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _supervise(self):
+        """Démarre les lecteurs une fois le bus créé, puis relaie les chutes au dispatcher."""
+        info = self.info.get()
+        if info is None:
+            self.procs[0].join()
+            return
+        spec, self.source_fps, step, size = info
+        self.bus = FrameBus.attach(spec)
+
+        analysis = self._ctx.Process(target=_analysis_process, name=f"{self.name}-detect",
+                                     args=(self.name, spec, self.source_fps, step, size, self.events,
+                                           self.counters, self.latency_hist, self.process_hist,
+                                           (self.frame_state, self.clip_state, self.clip_hist)))
+        analysis.start()
+        self.procs.append(analysis)
+        if self.preview:
+            viewer = self._ctx.Process(target=_preview_process, name=f"{self.name}-preview", args=(self.name, spec))
+            viewer.start()
+            self.procs.append(viewer)
+
+        while analysis.is_alive() or not self.events.empty():
+            try:
+                frame_idx, time_sec, clip = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if self.alerts is not None:
+                self.alerts.dispatch(frame_idx, self.name, time_sec, clip)
+
+        self.stop_event.set()  # Fin de l'analyse : le décodeur (et l'aperçu) s'arrêtent
+        for p in self.procs: p.join(5.0)
+
+    # -----------------------------------------
+    #   Statistiques (lues dans la mémoire partagée)
+    # -----------------------------------------
+
+    def _totals(self):
+        dropped = self.bus.dropped(READER_DETECT) if self.bus is not None else 0
+        return int(self.counters[0]), self.counters[1], dropped
+
+    def stats(self):
+        processed, latency_sum, dropped = self._totals()
+        last_processed, last_latency, last_dropped = self._last
+        now = time.perf_counter()
+        elapsed = max(now - self.win_start, 1e-6)
+        n = processed - last_processed
+        s = {
+            "name": self.name,
+            "fps": n / elapsed,
+            "latency_avg_ms": ((latency_sum - last_latency) / n * 1000) if n else 0.0,
+            "latency_max_ms": self.counters[2] * 1000,
+            "dropped": dropped - last_dropped,
+            "queued": self.bus.lag(READER_DETECT) if self.bus is not None else 0,
+            "total_processed": processed,
+            "total_dropped": dropped,
+        }
+        self.counters[2] = 0.0
+        self._last = (processed, latency_sum, dropped)
+        self.win_start = now
+        return s
+
+    def collect(self):
+        """Métriques Prometheus du flux ; état de détection et clips relus dans la mémoire partagée."""
+        labels = {"camera": self.name}
+        processed, _, dropped = self._totals()
+        return [
+            Metric("fallcall_frames_processed_total", "counter", "Frames analysées").add(labels, processed),
+            Metric("fallcall_frames_dropped_total", "counter",
+                   "Frames jetées car l'analyse était en retard").add(labels, dropped),
+            Metric("fallcall_queue_depth", "gauge", "Frames en attente d'analyse").add(
+                labels, self.bus.lag(READER_DETECT) if self.bus is not None else 0),
+            Metric("fallcall_stream_up", "gauge", "1 si le flux est actif").add(labels, self.is_alive()),
+            Metric("fallcall_frame_latency_seconds", "histogram",
+                   "Délai entre décodage et résultat d'une frame").add(labels, self.latency_hist),
+            Metric("fallcall_process_seconds", "histogram",
+                   "Durée de FallDetector.process() par frame").add(labels, self.process_hist),
+        ] + telemetry.frame_metrics(labels, self.frame_state.snapshot()) \
+          + telemetry.clip_metrics(labels, self.clip_state.snapshot(write_hist=self.clip_hist))
+
+
+def print_stats(streams):
+    print(f"\n{'FLUX'.ljust(20)} {'FPS':>6} {'LAT MOY':>9} {'LAT MAX':>9} {'JETEES':>7} {'FILE':>5}")
+    for st in streams:
+        s = st.stats()
+        print(f"{s['name'][:20].ljust(20)} {s['fps']:6.1f} {s['latency_avg_ms']:7.1f}ms "
+              f"{s['latency_max_ms']:7.1f}ms {s['dropped']:7d} {s['queued']:5d}")
+
+
+def load_sources(argv):
+    """Sources passées en ligne de commande, sinon cfg.CAMERA_SOURCES."""
+    if argv:
+        return [{"name": os.path.basename(str(a)) or str(a), "source": int(a) if a.isdigit() else a} for a in argv]
+    return list(cfg.CAMERA_SOURCES)
+
+
+def run_server(sources, processes=False, preview=False):
+    """`processes` : un process de décodage et un d'analyse par caméra (bus de frames partagé)."""
+    # Un seul dispatcher pour tous les flux ; pas de son sur le serveur
+    alerts = AlertDispatcher(sound_path=None)
+    if processes:
+        streams = [BusStream(s.get("name", str(s["source"])), s["source"], alerts, preview) for s in sources]
+    else:
+        streams = [CameraStream(s.get("name", str(s["source"])), s["source"], alerts) for s in sources]
+    for st in streams: telemetry.REGISTRY.register(st.collect)
+    telemetry.REGISTRY.register(lambda: telemetry.alert_metrics(alerts))
+    telemetry.start_http_server()
+    print(f"--- Serveur FallCall : {len(streams)} flux{' (multi-process)' if processes else ''} ---")
+    for st in streams: st.start()
+
+    try:
+        while any(st.is_alive() for st in streams):
+            time.sleep(cfg.STATS_INTERVAL)
+            print_stats(streams)
+    except KeyboardInterrupt:
+        print("\nArrêt demandé...")
+        for st in streams: st.stop()
+
+    for st in streams: st.join(timeout=2.0)
+    alerts.close()
+    return streams
+
+
+if __name__ == "__main__":
+    #   python server.py [--processes [--preview]] [sources...]
+    args = sys.argv[1:]
+    sources = load_sources([a for a in args if not a.startswith("--")])
+    if not sources:
+        print("❌ Aucune source : renseignez CAMERA_SOURCES dans config.py ou passez des chemins/URL.")
+    else:
+        run_server(sources, processes="--processes" in args, preview="--preview" in args)
@@ -0,0 +1,251 @@
+import abc
+import queue
+import shutil
+import subprocess
+import threading
+import numpy as np
+import cv2
+import config as cfg
+from detector import FallDetector, frame_step, iter_frames, scaled_size
+
+# =========================================
+#   SOURCES DE FRAMES (DECODAGE)
+# =========================================
+#
+# Une source produit (index_frame_source, frame) pour une frame sur `step`.
+# Backends :
+#   - "opencv" : cv2.VideoCapture, frames BGR natives (réduites / converties par le détecteur) ;
+#   - "ffmpeg" : process ffmpeg avec -vf scale,format=gray, frames grises déjà à l'échelle d'analyse ;
+#   - "pyav"   : décodage PyAV, conversion grise + réduction par swscale.
+# Avec `prefetch` > 0, un thread décode en avance (file bornée) : décodage et
+# analyse se recouvrent au lieu de s'additionner.
+
+BACKENDS = ("opencv", "ffmpeg", "pyav")
+
+_END = object()
+
+
+class Prefetcher:
+    """Parcourt `frames` dans un thread, au plus `depth` frames d'avance."""
+
+    def __init__(self, frames, depth):
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(frames,), name="decode-prefetch", daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, frames):
+        try:
+            for item in frames:
+                if not self._put(item): break
+        except Exception as e:
+            self.error = e  # Relancée côté lecteur
+        finally:
+            self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _END: break
+            yield item
+        if self.error is not None: raise self.error
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        self.thread.join(timeout)
+
+
+class FrameSource(abc.ABC):
+    """
+    Base des backends. `fps`, `size` (largeur, hauteur natives), `n_frames` (approximatif)
+    et `step` sont connus à l'ouverture. `gray` : les frames sont déjà en niveaux de gris,
+    image entière réduite à l'échelle `scale` ; sinon frames BGR natives.
+    """
+    gray = False
+
+    def __init__(self, source, analysis_fps, scale, prefetch):
+        self.source = source
+        self.scale = scale
+        self.prefetch = prefetch
+        self._prefetcher = None
+        self.fps, self.size, self.n_frames = self._open()
+        self.step = frame_step(self.fps, analysis_fps)
+
+    @property
+    def period(self):
+        """Durée réelle (s) entre deux frames analysées : 1 / fps du détecteur."""
+        return self.step / self.fps
+
+    def read(self, start=0):
+        """(index, frame) à partir de la frame source `start` (multiple de `step`)."""
+        if not self.prefetch:
+            return self.frames(start)
+        self._prefetcher = Prefetcher(self.frames(start), self.prefetch)
+        return iter(self._prefetcher)
+
+    def release(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+        self._close()
+
+    # A implémenter par chaque backend (un backend incomplet échoue dès sa création)
+    @abc.abstractmethod
+    def _open(self):
+        """Ouvre la source ; retourne (fps, (largeur, hauteur), nb_frames)."""
+
+    @abc.abstractmethod
+    def isOpened(self): ...
+
+    @abc.abstractmethod
+    def frames(self, start=0):
+        """Générateur (index, frame), une frame source sur `step`."""
+
+    def _close(self): pass
+
+
+class OpenCVSource(FrameSource):
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.source)
+        size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return self.cap.get(cv2.CAP_PROP_FPS) or 30.0, size, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def frames(self, start=0):
+        if start: self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        return iter_frames(self.cap, self.step, start)
+
+    def _close(self):
+        self.cap.release()
+
+
+def _probe(source):
+    """(fps, taille, nb_frames) lus par OpenCV : même taille (rotation comprise) que son décodage."""
+    cap = cv2.VideoCapture(source)
+    try:
+        if not cap.isOpened(): return 0.0, (0, 0), 0
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return cap.get(cv2.CAP_PROP_FPS) or 30.0, size, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+class FFmpegSource(FrameSource):
+    gray = True
+
+    def _open(self):
+        if not isinstance(self.source, str):
+            raise ValueError("Backend ffmpeg : source fichier ou URL uniquement (pas d'index de webcam)")
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("Backend ffmpeg : exécutable ffmpeg introuvable dans le PATH")
+        self.proc = None
+        return _probe(self.source)
+
+    def isOpened(self):
+        return self.size[0] > 0
+
+    def frames(self, start=0):
+        width, height = scaled_size(*self.size, self.scale)
+        vf = [f"select=not(mod(n\\,{self.step}))"] if self.step > 1 else []
+        vf += [f"scale={width}:{height}:flags=area", "format=gray"]
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+        if start: cmd += ["-ss", f"{start / self.fps:.6f}"]  # Seek précis (décodage depuis la clé précédente)
+        cmd += ["-i", self.source, "-vf", ",".join(vf), "-vsync", "0", "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=width * height * 4)
+
+        idx = start
+        n_bytes = width * height
+        while True:
+            buf = bytearray(n_bytes)  # Nouveau buffer par frame : le détecteur garde la précédente
+            if self.proc.stdout.readinto(buf) < n_bytes: break
+            yield idx, np.frombuffer(buf, np.uint8).reshape(height, width)
+            idx += self.step
+        self._close()
+
+    def _close(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+
+class PyAVSource(FrameSource):
+    gray = True
+    on_packet = None  # Appelé avec chaque paquet encodé (clips.py), avant décodage
+
+    def _open(self):
+        try:
+            import av
+        except ImportError:
+            raise RuntimeError("Backend pyav : module PyAV non installé (pip install av)")
+        try:
+            self.container = av.open(self.source if isinstance(self.source, str) else str(self.source))
+        except Exception as e:
+            print(f"⚠️ PyAV : {e}")
+            self.container = None
+            return 30.0, (0, 0), 0
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"  # Décodage multi-thread (frames et slices)
+        fps = float(self.stream.average_rate or 30.0)
+        return fps, (self.stream.codec_context.width, self.stream.codec_context.height), self.stream.frames
+
+    def isOpened(self):
+        return self.container is not None
+
+    def frames(self, start=0):
+        width, height = scaled_size(*self.size, self.scale)
+        stream = self.stream
+        t0 = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+        if start:
+            # Seek sur la clé précédente, puis frames repérées par leur timestamp
+            self.container.seek(int((t0 + start / self.fps) / stream.time_base), stream=stream, backward=True)
+
+        idx = 0
+        for packet in self.container.demux(stream):
+            if self.on_packet is not None: self.on_packet(packet)
+            for frame in packet.decode():
+                if start and frame.time is not None:
+                    idx = int(round((frame.time - t0) * self.fps))
+                if idx >= start and idx % self.step == 0:
+                    gray = frame.reformat(width=width, height=height, format="gray", interpolation="AREA")
+                    yield idx, gray.to_ndarray()
+                idx += 1
+
+    def _close(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+_BACKEND_CLASSES = {"opencv": OpenCVSource, "ffmpeg": FFmpegSource, "pyav": PyAVSource}
+
+def open_source(source, backend=None, analysis_fps=None, scale=None, params=None, prefetch=None):
+    """
+    Ouvre une source avec le backend de décodage choisi (cfg.DECODE_BACKEND par défaut)
+    et prépare le détecteur adapté à son fps. Retourne (src, detector) ;
+    src.isOpened() est à vérifier par l'appelant.
+    """
+    backend = backend or cfg.DECODE_BACKEND
+    if backend not in _BACKEND_CLASSES:
+        raise ValueError(f"Backend de décodage inconnu : {backend} (choix : {', '.join(BACKENDS)})")
+    if analysis_fps is None: analysis_fps = cfg.ANALYSIS_FPS
+    if scale is None: scale = cfg.ANALYSIS_SCALE
+    if prefetch is None: prefetch = cfg.DECODE_PREFETCH
+
+    src = _BACKEND_CLASSES[backend](source, analysis_fps, scale, prefetch)
+    detector = FallDetector(fps=src.fps / src.step, scale=scale, params=params)
+    detector.source_size = src.size
+    return src, detector
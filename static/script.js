@@ -1,32 +1,45 @@
-async function refreshStatus() {
-  try {
-    const response = await fetch('/api/last-alert');
-    const data = await response.json();
+let shownAlertId = null;
 
-    // data.hasAlert (booléen) + data.alert (objet ou null)
-    const statusText = document.getElementById('status-text'); // l’élément qui affiche le texte
-    const timeSpan   = document.getElementById('time-span');   // optionnel si tu as des spans
-    const sourceSpan = document.getElementById('source-span');
+function showAlert(alert) {
+  // Une alerte résolue n'est plus affichée
+  if (alert && alert.status === 'resolved') alert = null;
+  shownAlertId = alert ? alert.id : null;
 
-    if (data.hasAlert && data.alert) {
-      const alert = data.alert;
+  const statusText = document.getElementById('status-text'); // l’élément qui affiche le texte
+  const timeSpan   = document.getElementById('time-span');   // optionnel si tu as des spans
+  const sourceSpan = document.getElementById('source-span');
 
+  if (alert) {
+    if (alert.status === 'acknowledged') {
+      statusText.textContent = "Chute détectée (prise en charge)";
+      statusText.style.color = "#ffa64d"; // orange
+    } else {
       statusText.textContent = "Chute détectée !";
       statusText.style.color = "#ff4d4d"; // rouge
+    }
 
-      // Détails optionnels
-      if (timeSpan) {
-        timeSpan.textContent = alert.time.toFixed(2) + " s";
-      }
-      if (sourceSpan) {
-        sourceSpan.textContent = alert.source || "source inconnue";
-      }
-    } else {
-      statusText.textContent = "Aucune chute détectée.";
-      statusText.style.color = "#4caf50"; // vert
-      if (timeSpan) timeSpan.textContent = "";
-      if (sourceSpan) sourceSpan.textContent = "";
+    // Détails optionnels
+    if (timeSpan) {
+      timeSpan.textContent = alert.time != null ? alert.time.toFixed(2) + " s" : "";
     }
+    if (sourceSpan) {
+      sourceSpan.textContent = alert.source || "source inconnue";
+    }
+  } else {
+    statusText.textContent = "Aucune chute détectée.";
+    statusText.style.color = "#4caf50"; // vert
+    if (timeSpan) timeSpan.textContent = "";
+    if (sourceSpan) sourceSpan.textContent = "";
+  }
+}
+
+async function refreshStatus() {
+  try {
+    const response = await fetch('/api/last-alert');
+    const data = await response.json();
+
+    // data.hasAlert (booléen) + data.alert (objet ou null)
+    showAlert(data.hasAlert ? data.alert : null);
   } catch (err) {
     console.error("Erreur lors de l’appel /api/last-alert :", err);
   }
@@ -38,6 +51,20 @@ if (refreshBtn) {
   refreshBtn.addEventListener('click', refreshStatus);
 }
 
-// Rafraîchissement auto toutes les 5 secondes
-setInterval(refreshStatus, 1000);
 refreshStatus();
+
+if (window.EventSource) {
+  // Alertes poussées par le serveur (SSE) : plus de requête périodique.
+  // En cas de coupure le navigateur se reconnecte seul et renvoie Last-Event-ID.
+  const events = new EventSource('/api/alerts/stream');
+  events.addEventListener('alert', (e) => showAlert(JSON.parse(e.data)));
+  // Prise en charge / résolution de l'alerte affichée
+  events.addEventListener('status', (e) => {
+    const alert = JSON.parse(e.data);
+    if (alert.id === shownAlertId) showAlert(alert);
+  });
+  events.onerror = () => console.warn("Flux d'alertes interrompu, reconnexion...");
+} else {
+  // Navigateur sans EventSource : ancien rafraîchissement périodique
+  setInterval(refreshStatus, 1000);
+}
@@ -0,0 +1,211 @@
+import bisect
+import threading
+import types
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config as cfg
+
+# =========================================
+#   METRIQUES EN DIRECT (FORMAT PROMETHEUS)
+# =========================================
+#
+# Exposition texte Prometheus sur http://<hôte>:TELEMETRY_PORT/metrics, sans dépendance.
+# Coût minimal dans la boucle d'analyse : seuls les histogrammes de latence sont
+# mis à jour par frame ; compteurs et jauges sont lus dans l'état des flux au moment
+# où Prometheus vient les chercher (collecteurs).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Histogramme à buckets fixes ; un seul thread écrivain (le worker du flux)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Dernier : +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class SharedHistogram(Histogram):
+    """Histogramme en mémoire partagée : observé dans un process fils, exporté par le parent."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = multiprocessing.RawArray("q", len(self.buckets) + 1)
+        self._totals = multiprocessing.RawArray("d", 2)  # Somme, nombre
+
+    @property
+    def sum(self): return self._totals[0]
+    @sum.setter
+    def sum(self, value): self._totals[0] = value
+
+    @property
+    def count(self): return int(self._totals[1])
+    @count.setter
+    def count(self, value): self._totals[1] = value
+
+
+class SharedState:
+    """
+    Champs numériques d'un objet, copiés dans la mémoire partagée par un process fils ;
+    le parent les relit comme attributs (snapshot) pour les mêmes collecteurs qu'en threads.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)  # (nom, type)
+        self._values = multiprocessing.RawArray("d", len(self.fields))
+        self._ready = multiprocessing.RawValue("b", 0)
+
+    def update(self, obj):
+        for i, (name, _) in enumerate(self.fields):
+            self._values[i] = getattr(obj, name)
+        self._ready.value = 1
+
+    def snapshot(self, **extra):
+        """Objet portant les derniers champs écrits (+ `extra`) ; None avant la 1ère écriture."""
+        if not self._ready.value: return None
+        values = {name: kind(v) for (name, kind), v in zip(self.fields, self._values)}
+        return types.SimpleNamespace(**values, **extra)
+
+
+class Metric:
+    """Une famille de métriques : nom, type, aide et échantillons [(labels, valeur)]."""
+
+    def __init__(self, name, kind, help_text):
+        self.name, self.kind, self.help = name, kind, help_text
+        self.samples = []
+
+    def add(self, labels, value):
+        self.samples.append((labels, value))
+        return self
+
+
+def _labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items: return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+def _value(v):
+    if v is None: return "NaN"
+    return repr(float(v)) if not isinstance(v, bool) else ("1" if v else "0")
+
+
+class Registry:
+    def __init__(self):
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, collector):
+        """`collector()` retourne une liste de Metric, appelée à chaque lecture."""
+        with self._lock: self._collectors.append(collector)
+
+    def unregister(self, collector):
+        with self._lock: self._collectors.remove(collector)
+
+    def render(self):
+        families = {}
+        with self._lock: collectors = list(self._collectors)
+        for collect in collectors:
+            for metric in collect():
+                fam = families.setdefault(metric.name, Metric(metric.name, metric.kind, metric.help))
+                fam.samples.extend(metric.samples)
+
+        lines = []
+        for fam in families.values():
+            lines.append(f"# HELP {fam.name} {fam.help}")
+            lines.append(f"# TYPE {fam.name} {fam.kind}")
+            for labels, value in fam.samples:
+                if fam.kind == "histogram":
+                    cumulative = 0
+                    for le, n in zip(value.buckets + (float("inf"),), value.counts):
+                        cumulative += n
+                        bound = "+Inf" if le == float("inf") else repr(le)
+                        lines.append(f"{fam.name}_bucket{_labels(labels, {'le': bound})} {cumulative}")
+                    lines.append(f"{fam.name}_sum{_labels(labels)} {_value(value.sum)}")
+                    lines.append(f"{fam.name}_count{_labels(labels)} {value.count}")
+                else:
+                    lines.append(f"{fam.name}{_labels(labels)} {_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+FRAME_FIELDS = (("is_night", bool), ("idle", bool), ("brightness", float), ("area", float),
+                ("dy", int), ("fall_counter", int), ("frame_idx", int))
+
+def frame_metrics(labels, res):
+    """Jauges de l'état de détection à partir du dernier FrameResult d'un flux."""
+    if res is None: return []
+    return [
+        Metric("fallcall_night_mode", "gauge", "1 si le flux est en mode nuit").add(labels, res.is_night),
+        Metric("fallcall_idle", "gauge", "1 si le flux est en veille (scène immobile)").add(labels, res.idle),
+        Metric("fallcall_brightness", "gauge", "Luminosité estimée de la dernière frame").add(labels, res.brightness),
+        Metric("fallcall_motion_area", "gauge", "Surface de mouvement de la dernière frame (px²)").add(labels, res.area),
+        Metric("fallcall_dy", "gauge", "Dernier déplacement vertical mesuré (px)").add(labels, res.dy),
+        Metric("fallcall_fall_counter", "gauge", "Compteur de validation de chute").add(labels, res.fall_counter),
+        Metric("fallcall_last_frame", "gauge", "Index source de la dernière frame analysée").add(labels, res.frame_idx),
+    ]
+
+def alert_metrics(dispatcher):
+    """Compteurs d'un AlertDispatcher."""
+    return [
+        Metric("fallcall_alerts_sent_total", "counter", "Alertes délivrées au dashboard").add({}, dispatcher.sent),
+        Metric("fallcall_alerts_failed_total", "counter", "Envois d'alertes en échec").add({}, dispatcher.failed),
+        Metric("fallcall_alerts_pending", "gauge", "Alertes en file de reprise").add({}, len(dispatcher.pending)),
+        Metric("fallcall_alerts_dropped_total", "counter", "Alertes jetées (file de reprise pleine ou refusées par le dashboard)").add({}, dispatcher.dropped),
+    ]
+
+
+CLIP_FIELDS = (("bytes", int), ("written", int), ("dropped", int))
+
+def clip_metrics(labels, recorder):
+    """Tampon et écritures d'un ClipRecorder (clips.py)."""
+    if recorder is None: return []
+    return [
+        Metric("fallcall_clip_buffer_bytes", "gauge", "Mémoire du tampon de clip compressé").add(labels, recorder.bytes),
+        Metric("fallcall_clips_written_total", "counter", "Clips avant / après chute écrits").add(labels, recorder.written),
+        Metric("fallcall_clip_frames_dropped_total", "counter",
+               "Frames non gardées (compression en retard)").add(labels, recorder.dropped),
+        Metric("fallcall_clip_write_seconds", "histogram", "Durée d'écriture d'un clip").add(labels, recorder.write_hist),
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Pas de log par requête
+
+
+def start_http_server(port=cfg.TELEMETRY_PORT, host=cfg.TELEMETRY_HOST, registry=REGISTRY):
+    """Sert /metrics dans un thread ; retourne le serveur, ou None si désactivé / port pris."""
+    if not port: return None
+    handler = type("Handler", (_Handler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"⚠️ Métriques indisponibles sur {host}:{port} : {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Métriques Prometheus : http://{host}:{port}/metrics")
+    return server
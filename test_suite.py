@@ -1,119 +1,63 @@
 import os
-import cv2
-import numpy as np
-import matplotlib.pyplot as plt
-from collections import deque
+import argparse
 import concurrent.futures
 import time
+import cv2
+import numpy as np
 import config as cfg 
-# =========================================
-#   FONCTIONS (Identique Main)
-# =========================================
+from traces import load_or_extract, replay, extract_trace, plan_segments, merge_traces, trace_path, hash_files
+from sources import BACKENDS
+from detector import FallDetector
 
-def apply_light_condition(gray, brightness):
-    if brightness < cfg.DARKNESS_THRESHOLD:
-        gray_proc = cv2.GaussianBlur(gray, cfg.NIGHT_BLUR, 0)
-        clahe = cv2.createCLAHE(clipLimit=cfg.NIGHT_CLAHE, tileGridSize=(8, 8))
-        gray_proc = clahe.apply(gray_proc)
-        return (gray_proc, cfg.NIGHT_THRESHOLD, cfg.NIGHT_MIN_AREA, cfg.DY_NIGHT_THRESHOLD)
-    else:
-        gray_proc = cv2.GaussianBlur(gray, cfg.DAY_BLUR, 0)
-        return (gray_proc, cfg.DAY_THRESHOLD, cfg.DAY_MIN_AREA, cfg.DY_DAY_THRESHOLD)
+# Quelles vidéos ont un graphique : aucune, les mal classées, ou toutes
+PLOT_MODES = ("none", "failures", "all")
 
 # =========================================
 #   MOTEUR D'ANALYSE (Avec enregistrement Stats)
 # =========================================
 
-def analyze_video(video_filename):
+def analyze_video(video_filename, scale=None, use_cache=True, series=False, backend=None):
+    """
+    Analyse une vidéo de TEST_CASES.
+    Les features par frame sont extraites une fois puis mises en cache (traces.py) :
+    si seuls les paramètres de décision changent, la vidéo n'est pas redécodée.
+    Retourne (chute_detectee, nb_frames, temps_cpu_analyse, séries) ou None si introuvable.
+    `series` : renvoie aussi les séries compactes à tracer (sinon None).
+    `backend` : décodeur utilisé pour l'extraction (sources.py).
+    """
     path = os.path.join(cfg.VIDEOS_DIR, video_filename)
     if not os.path.exists(path): return None 
 
-    cap = cv2.VideoCapture(path)
-    prev_gray = None
-    
-    y_history = deque(maxlen=cfg.ANALYSIS_STRIDE + 1)
-    y_buffer_smooth = deque(maxlen=cfg.SMOOTHING_WINDOW)
-    
-    fall_counter = 0
-    detected = False
-    detected_frame = None
-
-    # Data pour stats
-    data_frames, data_dy, data_area, data_lum = [], [], [], []
-    frame_idx = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        
-        current_dy = 0
-        area = 0
-        
-        if cfg.ROTATE_VIDEO:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-        gray_raw = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        avg_brightness = np.mean(gray_raw)
-        
-        (gray_active, threshold_pixel, min_area_mode, dy_threshold_mode) = apply_light_condition(gray_raw, avg_brightness)
-
-        if prev_gray is not None:
-            diff = cv2.absdiff(gray_active, prev_gray)
-            _, motion_mask = cv2.threshold(diff, threshold_pixel, 255, cv2.THRESH_BINARY)
-            kernel = np.ones((5, 5), np.uint8)
-            motion_mask = cv2.morphologyEx(motion_mask, cv2.MORPH_OPEN, kernel)
-            moments = cv2.moments(motion_mask)
-            area = moments["m00"]
-
-            if area > min_area_mode:
-                y_raw = int(moments["m01"] / moments["m00"])
-                
-                # Lissage
-                y_buffer_smooth.append(y_raw)
-                y_smooth = int(sum(y_buffer_smooth) / len(y_buffer_smooth))
-                
-                # Forme
-                x, y, w, h = cv2.boundingRect(motion_mask)
-                is_horizontal = w*1.2 >= h 
-
-                y_history.append(y_smooth)
-
-                if len(y_history) > cfg.ANALYSIS_STRIDE:
-                    current_dy = y_history[-1] - y_history[0]
-                    if abs(y_history[-1] - y_history[-2]) < 3: current_dy = 0
-
-                    if (current_dy > dy_threshold_mode) and (current_dy < cfg.MAX_DY) and is_horizontal:
-                        fall_counter += 1
-                    else:
-                        if fall_counter > 0: fall_counter -= 1
-
-                    if fall_counter >= cfg.CONSECUTIVE_VALIDATIONS:
-                        if not detected: 
-                            detected = True
-                            detected_frame = frame_idx
-            else:
-                if len(y_history) > 0: y_history.popleft() 
-                y_buffer_smooth.clear()
-                fall_counter = 0
-
-        prev_gray = gray_active.copy()
-        
-        # Enregistrement Stats
-        data_frames.append(frame_idx)
-        data_dy.append(current_dy)
-        data_area.append(area)
-        data_lum.append(avg_brightness)
-        
-        frame_idx += 1
-
-    cap.release()
-    
-    # --- GENERATION GRAPHIQUE SILENCIEUSE ---
-    generate_stat_graph(video_filename, data_frames, data_dy, data_area, data_lum, detected_frame)
+    trace, _ = load_or_extract(path, scale, use_cache, backend)
+    return analyze_trace(trace, series)
+
+def analyze_trace(trace, series=False):
+    """Décision rejouée sur une trace : même retour que analyze_video()."""
+    out = replay(trace, series=series)
+
+    data = None
+    if series:
+        data = {
+            "frames": np.asarray(out.frames, np.int32),
+            "dys": np.asarray(out.dys, np.int32),
+            "areas": np.asarray(out.areas, np.float32),
+            "lums": trace["brightness"].astype(np.float32),
+            "fall_frame": out.fall_frame,
+        }
     
-    return detected
+    # temps CPU : celui de l'analyse d'image, mesuré à l'extraction de la trace
+    return out.detected, len(trace), trace.cpu_time, data
+
+def plot_task(item):
+    filename, data = item
+    generate_stat_graph(filename, data["frames"], data["dys"], data["areas"], data["lums"], data["fall_frame"])
 
 def generate_stat_graph(filename, frames, dys, areas, lums, fall_frame):
+    # Import ici : une suite sans graphique ne charge jamais matplotlib
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
     os.makedirs(cfg.STATS_DIR, exist_ok=True)
     
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(8, 10), sharex=True)
@@ -154,42 +98,289 @@ def generate_stat_graph(filename, frames, dys, areas, lums, fall_frame):
 #   LANCEMENT DU TEST
 # =========================================
 
+def keep_series(result, expected, plots):
+    # Séries gardées seulement si un graphique sera fait ("failures" : on ne sait
+    # qu'après l'analyse, on les calcule puis on les jette si la vidéo est bien classée)
+    if result is not None and plots == "failures" and result[0] == expected:
+        result = result[:3] + (None,)
+    return result
+
 def process_video_task(item):
-    filename, expected = item
-    result = analyze_video(filename)
-    return (filename, expected, result)
+    filename, expected, scale, use_cache, plots, backend = item
+    result = analyze_video(filename, scale, use_cache, series=plots != "none", backend=backend)
+    return (filename, expected, keep_series(result, expected, plots))
+
+def _init_worker():
+    # Le parallélisme vient du pool : OpenCV mono-thread dans chaque process
+    cv2.setNumThreads(cfg.SUITE_CV_THREADS)
+
+def run_suite(scale=None, verbose=True, use_cache=True, plots="none", backend=None):
+    """
+    Lance tous les TEST_CASES en parallèle.
+    - les vidéos les plus lourdes partent en premier, les résultats s'affichent dès qu'ils arrivent ;
+    - une longue vidéo sans trace en cache est extraite en segments parallèles, recollés ici ;
+    - les graphiques (`plots` : none / failures / all) sont faits à part, dans un second
+      pool alimenté au fil des résultats, pour ne pas ralentir l'analyse.
+    Retourne ({filename: detected ou None}, nb de succès, ms CPU par frame).
+    """
+    decisions = {}
+    success_count = 0
+    total_frames, total_cpu = 0, 0.0
+    plot_jobs = []
+
+    videos = []
+    for filename, expected in cfg.TEST_CASES.items():
+        path = os.path.join(cfg.VIDEOS_DIR, filename)
+        if not os.path.exists(path):
+            decisions[filename] = None
+            if verbose: print(f"⚠️  {filename.ljust(35)} : INTROUVABLE")
+            continue
+        videos.append((os.path.getsize(path), filename, expected, path))
+    videos.sort(key=lambda v: v[0], reverse=True)
+    hash_files([v[3] for v in videos])  # Avant le pool : un seul écrivain de l'index des empreintes
+
+    plot_executor = concurrent.futures.ProcessPoolExecutor() if plots != "none" else None
+    with concurrent.futures.ProcessPoolExecutor(initializer=_init_worker) as executor:
+        futures, segments = {}, {}
+        for _, filename, expected, path in videos:
+            plan = plan_segments(path)
+            if len(plan) > 1 and not (use_cache and os.path.exists(trace_path(path, scale, backend))):
+                segments[filename] = [None] * len(plan)
+                for k, (start, stop, warmup) in enumerate(plan):
+                    future = executor.submit(extract_trace, path, scale, start, stop, warmup, backend)
+                    futures[future] = (filename, expected, path, k)
+            else:
+                future = executor.submit(process_video_task, (filename, expected, scale, use_cache, plots, backend))
+                futures[future] = (filename, expected, path, None)
+
+        for future in concurrent.futures.as_completed(futures):
+            filename, expected, path, k = futures[future]
+            if k is None:
+                result = future.result()[2]
+            else:
+                parts = segments[filename]
+                parts[k] = future.result()
+                if any(p is None for p in parts): continue
+                trace = merge_traces(parts)
+                if use_cache: trace.save(trace_path(path, scale, backend))
+                result = keep_series(analyze_trace(trace, series=plots != "none"), expected, plots)
+
+            detected, n_frames, cpu_time, data = result
+            decisions[filename] = detected
+            total_frames += n_frames
+            total_cpu += cpu_time
+            if data is not None:
+                plot_jobs.append(plot_executor.submit(plot_task, (filename, data)))
+
+            if detected == expected:
+                if verbose: print(f"✅ {filename.ljust(35)} : OK")
+                success_count += 1
+            elif verbose:
+                attendu = "CHUTE" if expected else "RIEN"
+                recu = "CHUTE" if detected else "RIEN"
+                print(f"❌ {filename.ljust(35)} : ERREUR (Attendu: {attendu}, Reçu: {recu})")
+
+    if plot_executor is not None:
+        for job in plot_jobs: job.result()
+        plot_executor.shutdown()
+
+    ms_per_frame = (total_cpu / total_frames * 1000) if total_frames else 0.0
+    return decisions, success_count, ms_per_frame
+
+def compare_scales(scale, use_cache=True):
+    """Compare précision et coût CPU entre la pleine résolution et `scale`."""
+    print(f"--- COMPARAISON ECHELLE 1.0 / {scale} ---")
+    total_videos = len(cfg.TEST_CASES)
+    ref, ref_ok, ref_ms = run_suite(1.0, verbose=False, use_cache=use_cache)
+    low, low_ok, low_ms = run_suite(scale, verbose=False, use_cache=use_cache)
+
+    for filename in cfg.TEST_CASES:
+        if ref[filename] != low[filename]:
+            print(f"❌ {filename.ljust(35)} : décision différente (1.0: {ref[filename]}, {scale}: {low[filename]})")
+
+    print("-" * 60)
+    print(f"ECHELLE 1.0   : {ref_ok}/{total_videos}  {ref_ms:.2f} ms CPU/frame")
+    print(f"ECHELLE {scale:<5} : {low_ok}/{total_videos}  {low_ms:.2f} ms CPU/frame")
+    if low_ms > 0:
+        print(f"GAIN CPU      : x{ref_ms / low_ms:.1f}")
+    print("=" * 60)
+
+def backend_task(item):
+    filename, scale, use_cache, backend = item
+    trace, _ = load_or_extract(os.path.join(cfg.VIDEOS_DIR, filename), scale, use_cache, backend)
+    out = replay(trace)
+    brightness = float(np.mean(trace["brightness"])) if len(trace) else 0.0
+    return out.detected, out.fall_frame, brightness, trace.source_fps
+
+def compare_backends(backends, scale=None, use_cache=True):
+    """
+    Vérifie que les décodeurs donnent les mêmes résultats : même décision, frame de
+    chute à BACKEND_FALL_TOLERANCE_SEC près, luminosité moyenne à
+    BACKEND_BRIGHTNESS_TOLERANCE près (référence : le premier backend).
+    Retourne le nombre de vidéos en écart.
+    """
+    print(f"--- COMPARAISON DECODEURS {' / '.join(backends)} ---")
+    files = [f for f in cfg.TEST_CASES if os.path.exists(os.path.join(cfg.VIDEOS_DIR, f))]
+    hash_files([os.path.join(cfg.VIDEOS_DIR, f) for f in files])
+    items = [(f, scale, use_cache, b) for f in files for b in backends]
+    with concurrent.futures.ProcessPoolExecutor(initializer=_init_worker) as executor:
+        results = dict(zip(((f, b) for f, _, _, b in items), executor.map(backend_task, items)))
+
+    failures = 0
+    for filename in files:
+        ref_detected, ref_fall, ref_lum, fps = results[(filename, backends[0])]
+        tolerance = cfg.BACKEND_FALL_TOLERANCE_SEC * fps
+        for backend in backends[1:]:
+            detected, fall, lum, _ = results[(filename, backend)]
+            issues = []
+            if detected != ref_detected:
+                issues.append(f"décision {ref_detected} -> {detected}")
+            elif detected and abs(fall - ref_fall) > tolerance:
+                issues.append(f"chute frame {ref_fall} -> {fall}")
+            if abs(lum - ref_lum) > cfg.BACKEND_BRIGHTNESS_TOLERANCE:
+                issues.append(f"luminosité {ref_lum:.1f} -> {lum:.1f}")
+            if issues:
+                failures += 1
+                print(f"❌ {filename.ljust(35)} : {backend} : {', '.join(issues)}")
+            else:
+                print(f"✅ {filename.ljust(35)} : {backend} : OK")
+
+    print("-" * 60)
+    print(f"ECARTS : {failures} (sur {len(files)} vidéos x {len(backends) - 1} backend(s))")
+    print("=" * 60)
+    return failures
+
+# =========================================
+#   CLIPS SYNTHETIQUES DE NON-REGRESSION
+# =========================================
+# Générés à la volée (pas de fichier vidéo) : cas limites du suivi du corps,
+# vérifiables sans les vidéos de TEST_CASES.
+
+# nom -> (options de synthetic_fall_frames, chute attendue)
+SYNTHETIC_CASES = {
+    "synthetique_chute": ({}, True),
+    "synthetique_pas_de_chute": ({"fall": False}, False),
+    # Carré de 40 px qui clignote à côté du corps : le suivi ne doit pas s'y accrocher
+    "synthetique_chute_clignotant": ({"distractor": True}, True),
+    "synthetique_chute_clignotant_noir": ({"distractor": True, "night": True}, True),
+    "synthetique_pas_de_chute_clignotant": ({"fall": False, "distractor": True}, False),
+    # Immobile plus de IDLE_AFTER_SEC (veille) puis chute : réveil à temps
+    "synthetique_immobile_chute": ({"still": True, "fall_sec": 4.0, "n_frames": 210}, True),
+    "synthetique_immobile_chute_noir": ({"still": True, "fall_sec": 4.0, "n_frames": 210, "night": True}, True),
+}
+
+_UPRIGHT_TO_NATIVE = {"90_CW": cv2.ROTATE_90_COUNTERCLOCKWISE, "90_CCW": cv2.ROTATE_90_CLOCKWISE,
+                      "180": cv2.ROTATE_180}
+
+def synthetic_fall_frames(fall=True, distractor=False, night=False, still=False, fall_sec=1.5,
+                          n_frames=150, fps=30, seed=0):
+    """
+    (index, frame BGR native) d'une personne (rectangle texturé) qui oscille debout (immobile
+    si `still`) puis tombe à `fall_sec` si `fall` ; `distractor` : petit objet qui apparaît
+    une frame sur deux. Dessiné dans le repère debout (720 x 1280) puis tourné selon
+    cfg.ORIENTATION.
+    """
+    rng = np.random.default_rng(seed)
+    low, high = (5, 15) if night else (90, 160)
+    background = rng.integers(low, high, (1280, 720, 3), dtype=np.uint8)
+    color = (60, 60, 60) if night else (240, 240, 240)
+    rotation = _UPRIGHT_TO_NATIVE.get(cfg.ORIENTATION)
+    for i in range(n_frames):
+        frame = background.copy()
+        t = i / fps
+        sway = 0.0 if still else t
+        if fall and t > fall_sec:
+            k = min(1.0, (t - fall_sec) / 0.8)
+            w, h, y0 = int(120 + 320 * k), int(400 - 280 * k), int(200 + 900 * k)
+        else:
+            w, h, y0 = 120, 400, 200 + int(20 * np.sin(sway * 6))
+        x0 = 150 + int(40 * np.sin(sway * 3))
+        cv2.rectangle(frame, (x0, y0), (x0 + w, y0 + h), color, -1)
+        cv2.rectangle(frame, (x0 + 20, y0 + 20), (x0 + w // 2, y0 + h // 2), (0, 0, 0), -1)
+        if distractor and i % 2:
+            cv2.rectangle(frame, (560, 700), (600, 740), color, -1)
+        yield i, cv2.rotate(frame, rotation) if rotation is not None else frame
+
+def synthetic_fall(options, idle_after_sec=None):
+    """Frame de chute du moteur en flux sur un clip synthétique (None si aucune)."""
+    detector = FallDetector(fps=30, idle_after_sec=idle_after_sec)
+    for frame_idx, frame in synthetic_fall_frames(**options):
+        detector.process(frame, frame_idx)
+    return detector.fall_frame
+
+def run_synthetic():
+    """
+    Moteur en flux (réglages de config.py, veille comprise) sur SYNTHETIC_CASES, puis sans
+    veille : même décision, chute à IDLE_FALL_TOLERANCE_SEC près. Retourne le nombre d'échecs.
+    """
+    print("--- CLIPS SYNTHETIQUES ---")
+    failures = 0
+    tolerance = cfg.IDLE_FALL_TOLERANCE_SEC * 30
+    for name, (options, expected) in SYNTHETIC_CASES.items():
+        fall = synthetic_fall(options)
+        full = synthetic_fall(options, idle_after_sec=0)
+        if (fall is not None) != expected:
+            failures += 1
+            print(f"❌ {name.ljust(35)} : ERREUR (Attendu: {'CHUTE' if expected else 'RIEN'}, "
+                  f"Reçu: {'CHUTE' if fall is not None else 'RIEN'})")
+        elif (fall is None) != (full is None) or (fall is not None and abs(fall - full) > tolerance):
+            failures += 1
+            print(f"❌ {name.ljust(35)} : veille : chute {fall}, sans veille : {full}")
+        else:
+            print(f"✅ {name.ljust(35)} : OK (chute : {fall}, sans veille : {full})")
+    print("-" * 60)
+    print(f"ECHECS : {failures}/{len(SYNTHETIC_CASES)}")
+    print("=" * 60)
+    return failures
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suite de tests FallCall")
+    parser.add_argument("--scale", type=float, default=None,
+                        help="Echelle d'analyse (défaut : cfg.ANALYSIS_SCALE)")
+    parser.add_argument("--compare-scale", type=float, default=None, metavar="SCALE",
+                        help="Compare précision et CPU/frame entre 1.0 et SCALE")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore le cache de traces et redécode toutes les vidéos")
+    parser.add_argument("--plots", choices=PLOT_MODES, default="all",
+                        help="Graphiques à générer : aucun, vidéos mal classées, ou toutes (défaut)")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="Décodeur vidéo (défaut : cfg.DECODE_BACKEND)")
+    parser.add_argument("--compare-backends", default=None, metavar="A,B",
+                        help="Vérifie que ces décodeurs donnent les mêmes résultats (ex: opencv,ffmpeg)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Clips synthétiques de non-régression (sans les vidéos de TEST_CASES)")
+    args = parser.parse_args()
+
     os.system('cls' if os.name == 'nt' else 'clear')
+
+    if args.compare_scale is not None:
+        compare_scales(args.compare_scale, use_cache=not args.no_cache)
+        raise SystemExit
+
+    if args.synthetic:
+        raise SystemExit(1 if run_synthetic() else 0)
+
+    if args.compare_backends is not None:
+        backends = args.compare_backends.split(",")
+        unknown = set(backends) - set(BACKENDS)
+        if unknown or len(backends) < 2:
+            parser.error(f"--compare-backends : au moins deux décodeurs parmi {', '.join(BACKENDS)}")
+        raise SystemExit(1 if compare_backends(backends, args.scale, use_cache=not args.no_cache) else 0)
+
     print("--- SUITE DE TESTS + GENERATION STATS ---")
     
     # Nettoyage dossier stats
-    if os.path.exists(cfg.STATS_DIR):
+    if args.plots != "none" and os.path.exists(cfg.STATS_DIR):
         for f in os.listdir(cfg.STATS_DIR):
             try:
                 os.remove(os.path.join(cfg.STATS_DIR, f))
             except: pass
     
-    success_count = 0
-    # Correction ICI : Utilisation de TEST_CASES importé, pas cfg.TEST_CASES
-    total_videos = len(cfg.TEST_CASES)
-    
     start_time = time.time()  # <--- DÉBUT CHRONO
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        tasks = list(cfg.TEST_CASES.items())
-        results = executor.map(process_video_task, tasks)
-
-        for filename, expected, result in results:
-            if result is None:
-                print(f"⚠️  {filename.ljust(35)} : INTROUVABLE")
-            elif result == expected:
-                print(f"✅ {filename.ljust(35)} : OK")
-                success_count += 1
-            else:
-                attendu = "CHUTE" if expected else "RIEN"
-                recu = "CHUTE" if result else "RIEN"
-                print(f"❌ {filename.ljust(35)} : ERREUR (Attendu: {attendu}, Reçu: {recu})")
+    total_videos = len(cfg.TEST_CASES)
+    _, success_count, ms_per_frame = run_suite(args.scale, use_cache=not args.no_cache, plots=args.plots,
+                                               backend=args.backend)
 
     end_time = time.time()    # <--- FIN CHRONO
     duration = end_time - start_time
@@ -197,6 +388,8 @@ if __name__ == "__main__":
     score = (success_count / total_videos) * 100
     print("-" * 60)
     print(f"TEMPS TOTAL : {duration:.2f} secondes")
+    print(f"CPU / FRAME : {ms_per_frame:.2f} ms")
     print(f"SCORE FINAL : {score:.1f}% ({success_count}/{total_videos})")
-    print(f"Les graphiques d'analyse sont dans : {cfg.STATS_DIR}")
-    print("=" * 60)
\ No newline at end of file
+    if args.plots != "none":
+        print(f"Les graphiques d'analyse sont dans : {cfg.STATS_DIR}")
+    print("=" * 60)
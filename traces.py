@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import cv2
+import numpy as np
+import config as cfg
+from detector import FallDetector, frame_step, seconds_to_frames
+from sources import open_source
+
+# =========================================
+#   CACHE DE TRACES DE FEATURES
+# =========================================
+#
+# Les décisions ne dépendent que de quelques features par frame (mode, surface,
+# centroïde, boite). On les extrait une fois par vidéo dans un .npz colonne par
+# colonne, avec une clé = hash du fichier + paramètres du pipeline d'image.
+# Changer un paramètre de décision (DY_*_THRESHOLD, MIN_AREA, MAX_DY, durées...)
+# ne demande alors qu'un rejeu de la trace, sans décoder la vidéo.
+
+TRACE_VERSION = 5
+
+# Paramètres qui modifient les images / masques : ils font partie de la clé du cache
+PIPELINE_PARAMS = (
+    "ANALYSIS_SCALE", "ANALYSIS_FPS", "MORPH_KERNEL", "ORIENTATION", "BED_ROI",
+    "DAY_BLUR", "DAY_THRESHOLD", "DAY_CLAHE", "NIGHT_BLUR", "NIGHT_THRESHOLD", "NIGHT_CLAHE",
+    "DARKNESS_THRESHOLD", "DARKNESS_HYSTERESIS", "MODE_MIN_DWELL_SEC", "BRIGHTNESS_SUBSAMPLE",
+    "DAY_BLOB_MIN_PX", "NIGHT_BLOB_MIN_PX", "DAY_BODY_MIN_PX", "NIGHT_BODY_MIN_PX",
+    "BLOB_MERGE_PX", "BLOB_MASK_SCALE", "BLOB_SWITCH_RATIO", "BLOB_FORGET_SEC",
+)
+
+# Surface minimale nulle à l'extraction : la géométrie est enregistrée dès qu'il y a du
+# mouvement, le vrai minimum est appliqué au rejeu. Pas de veille non plus (cf.
+# extract_trace) : toutes les frames sont analysées, quel que soit le découpage en segments.
+EXTRACT_PARAMS = {"DAY_MIN_AREA": 0, "NIGHT_MIN_AREA": 0}
+
+COLUMNS = ("frame_idx", "brightness", "is_night", "has_prev", "area",
+           "y_raw", "x_center", "bbox", "is_horizontal", "body_switched")
+
+
+class FeatureTrace:
+    """Features par frame analysée d'une vidéo (tableaux NumPy) + métadonnées."""
+
+    def __init__(self, columns, fps, cpu_time=0.0):
+        self.columns = columns
+        self.fps = float(fps)
+        self.cpu_time = float(cpu_time)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["frame_idx"])
+
+    @property
+    def source_fps(self):
+        """Fps de la vidéo source (les frames analysées sont espacées de `step` frames source)."""
+        idx = self.columns["frame_idx"]
+        step = int(idx[1] - idx[0]) if len(idx) > 1 else 1
+        return self.fps * step
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, fps=self.fps, cpu_time=self.cpu_time, **self.columns)
+        os.replace(tmp, path)  # Ecriture atomique (workers en parallèle)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in COLUMNS}
+            return cls(columns, data["fps"], data["cpu_time"])
+
+# -----------------------------------------
+#   Clé du cache
+# -----------------------------------------
+
+def _hash_index_path():
+    return os.path.join(cfg.TRACES_DIR, "file_hashes.json")
+
+def _load_hash_index():
+    try:
+        with open(_hash_index_path()) as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+def _sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _save_hashes(new):
+    """Ajoute `new` à l'index, relu juste avant l'écriture (atomique) pour garder les autres entrées."""
+    index = _load_hash_index()
+    index.update(new)
+    os.makedirs(cfg.TRACES_DIR, exist_ok=True)
+    index_path = _hash_index_path()
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f: json.dump(index, f)
+    os.replace(tmp, index_path)
+
+def hash_files(paths):
+    """
+    Calcule en une fois les empreintes manquantes de `paths` et les enregistre. A appeler
+    dans le process parent avant de lancer un pool : les workers ne font alors que lire
+    l'index (plusieurs écrivains en parallèle perdraient des entrées).
+    """
+    index = _load_hash_index()
+    new = {}
+    for path in paths:
+        stamp = _file_stamp(path)
+        if stamp not in index: new[stamp] = _sha1_file(path)
+    if new: _save_hashes(new)
+
+def file_hash(path):
+    """SHA-1 du contenu, mémorisé par (chemin, taille, date) pour ne pas relire la vidéo."""
+    stamp = _file_stamp(path)
+    index = _load_hash_index()
+    if stamp not in index:
+        index[stamp] = _sha1_file(path)
+        _save_hashes({stamp: index[stamp]})
+    return index[stamp]
+
+def pipeline_params(scale=None, backend=None):
+    params = {name: getattr(cfg, name) for name in PIPELINE_PARAMS}
+    if scale is not None: params["ANALYSIS_SCALE"] = scale
+    params["TRACE_VERSION"] = TRACE_VERSION
+    # Le décodeur change légèrement les pixels ; OpenCV garde les clés existantes
+    backend = backend or cfg.DECODE_BACKEND
+    if backend != "opencv": params["DECODE_BACKEND"] = backend
+    return params
+
+def trace_path(path, scale=None, backend=None):
+    key = hashlib.sha1((file_hash(path) + json.dumps(pipeline_params(scale, backend), sort_keys=True)).encode())
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cfg.TRACES_DIR, f"{name}-{key.hexdigest()[:16]}.npz")
+
+# -----------------------------------------
+#   Extraction / rejeu
+# -----------------------------------------
+
+def extract_trace(path, scale=None, start=0, stop=None, warmup=0, backend=None):
+    """
+    Décode et analyse la vidéo une fois, en gardant les features de chaque frame.
+    `start` / `stop` : segment [start, stop) en frames source (stop None = fin) ;
+    `warmup` : frames analysées avant `start` pour amorcer l'état (frame précédente,
+    mode jour/nuit) puis écartées de la trace.
+    `backend` : décodeur (sources.py, cfg.DECODE_BACKEND par défaut).
+    """
+    src, detector = open_source(path, backend, scale=scale, params=EXTRACT_PARAMS)
+    # La veille dépend de l'immobilité passée (plus longue que le recouvrement d'un segment)
+    detector.idle_after = 0
+    first = max(0, start - warmup) // src.step * src.step
+    rows = []
+    cpu_time = 0.0
+
+    for frame_idx, frame in src.read(first):
+        if stop is not None and frame_idx >= stop: break
+        # Temps du thread d'analyse seul : le décodage tourne dans le thread de lecture
+        t0 = time.thread_time()
+        res = detector.process(frame, frame_idx)
+        cpu_time += time.thread_time() - t0
+        if frame_idx < start: continue
+        moving = res.y_raw is not None
+        rows.append((res.frame_idx, res.brightness, res.is_night, res.measured, res.area,
+                     res.y_raw if moving else -1, res.x_center if moving else -1,
+                     res.bbox if moving else (-1, -1, -1, -1), res.is_horizontal, res.body_switched))
+    src.release()
+
+    cols = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    columns = {
+        "frame_idx": np.array(cols[0], np.int64),
+        "brightness": np.array(cols[1], np.float64),
+        "is_night": np.array(cols[2], np.bool_),
+        "has_prev": np.array(cols[3], np.bool_),
+        "area": np.array(cols[4], np.float64),
+        "y_raw": np.array(cols[5], np.int32),
+        "x_center": np.array(cols[6], np.int32),
+        "bbox": np.array(cols[7], np.int32).reshape(-1, 4),
+        "is_horizontal": np.array(cols[8], np.bool_),
+        "body_switched": np.array(cols[9], np.bool_),
+    }
+    return FeatureTrace(columns, detector.fps, cpu_time)
+
+def plan_segments(path, segment_frames=cfg.SEGMENT_FRAMES):
+    """
+    Découpe une longue vidéo en segments [(start, stop, warmup)] en frames source,
+    bornes alignées sur le pas d'analyse. Une seule entrée si la vidéo est courte.
+    """
+    cap = cv2.VideoCapture(path)
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+
+    step = frame_step(source_fps, cfg.ANALYSIS_FPS)
+    size = max(step, segment_frames // step * step)
+    if n_frames <= size * 1.5:
+        return [(0, None, 0)]
+    warmup = seconds_to_frames(cfg.SEGMENT_WARMUP_SEC, source_fps)
+    starts = list(range(0, n_frames - size // 2, size))
+    # Dernier segment jusqu'à la fin réelle (le nombre de frames annoncé est approximatif)
+    return [(a, b, warmup if a else 0) for a, b in zip(starts, starts[1:] + [None])]
+
+def merge_traces(parts):
+    """Recolle les traces de segments consécutifs (dans l'ordre)."""
+    columns = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+    return FeatureTrace(columns, parts[0].fps, sum(p.cpu_time for p in parts))
+
+def load_or_extract(path, scale=None, use_cache=True, backend=None):
+    """Retourne (trace, venait_du_cache)."""
+    if not use_cache:
+        return extract_trace(path, scale, backend=backend), False
+    cache_path = trace_path(path, scale, backend)
+    if os.path.exists(cache_path):
+        try:
+            return FeatureTrace.load(cache_path), True
+        except (OSError, ValueError, KeyError):
+            pass  # Fichier corrompu : on le régénère
+    trace = extract_trace(path, scale, backend=backend)
+    trace.save(cache_path)
+    return trace, False
+
+
+class ReplayResult:
+    def __init__(self, detected, fall_frame, frames=None, dys=None, areas=None):
+        self.detected = detected
+        self.fall_frame = fall_frame
+        self.frames, self.dys, self.areas = frames, dys, areas
+
+def replay(trace, params=None, series=False, stop_at_fall=False):
+    """
+    Rejoue la logique de décision de FallDetector sur une trace, avec des paramètres
+    de décision éventuellement surchargés. `series` : garde dy / surface par frame.
+    `stop_at_fall` : s'arrête à la première chute validée (la décision ne change plus).
+    """
+    det = FallDetector(fps=trace.fps, params=params)
+    day, night = det.day_mode, det.night_mode
+    frame_idx = trace["frame_idx"].tolist()
+    brightness = trace["brightness"].tolist()
+    is_night = trace["is_night"].tolist()
+    has_prev = trace["has_prev"].tolist()
+    area = trace["area"].tolist()
+    y_raw = trace["y_raw"].tolist()
+    horizontal = trace["is_horizontal"].tolist()
+    body_switched = trace["body_switched"].tolist()
+    dys, areas = ([], []) if series else (None, None)
+
+    for i in range(len(frame_idx)):
+        det.frame_idx = frame_idx[i]
+        mode = night if is_night[i] else day
+        res = det.new_result(brightness[i], mode, False)
+        if has_prev[i]:
+            if body_switched[i]: det.restart_track()
+            res.area = area[i]
+            y = None
+            if area[i] > mode.min_area:
+                res.is_horizontal = horizontal[i]
+                y = y_raw[i]
+            det.update_state(res, mode, y)
+        det.end_frame(res)
+        if series:
+            dys.append(res.dy)
+            areas.append(res.area)
+        if stop_at_fall and det.fall_detected:
+            break
+
+    return ReplayResult(det.fall_detected, det.fall_frame, frame_idx[:len(dys)] if series else None, dys, areas)
+
+
+def same_traces(a, b):
+    """True si deux traces ont exactement les mêmes colonnes."""
+    return all(np.array_equal(a[name], b[name]) for name in COLUMNS)
+
+
+if __name__ == "__main__":
+    # python traces.py video...  -> vérifie que le rejeu donne la même décision que le moteur en flux,
+    #                               et qu'une extraction en segments redonne la trace en une passe
+    for path in sys.argv[1:]:
+        src, detector = open_source(path)
+        detector.idle_after = 0  # Comme à l'extraction : toutes les frames analysées
+        for frame_idx, frame in src.read():
+            detector.process(frame, frame_idx)
+        src.release()
+
+        trace, cached = load_or_extract(path)
+        t0 = time.perf_counter()
+        out = replay(trace)
+        t_replay = (time.perf_counter() - t0) * 1000
+
+        same = (out.detected, out.fall_frame) == (detector.fall_detected, detector.fall_frame)
+        print(f"{'✅' if same else '❌'} {os.path.basename(path).ljust(35)} : flux {detector.fall_frame}, "
+              f"rejeu {out.fall_frame} ({t_replay:.1f} ms, {'cache' if cached else 'extraite'})")
+
+        # Deux segments au moins, comme test_suite.py pour une longue vidéo
+        single = extract_trace(path) if cached else trace
+        plan = plan_segments(path, min(cfg.SEGMENT_FRAMES, int(single["frame_idx"][-1]) // 3 + 1))
+        merged = merge_traces([extract_trace(path, None, *segment) for segment in plan])
+        same = same_traces(merged, single)
+        print(f"{'✅' if same else '❌'} {os.path.basename(path).ljust(35)} : {len(plan)} segments, "
+              f"trace {'identique' if same else 'DIFFERENTE'} en une passe")
@@ -0,0 +1,192 @@
+import os
+import csv
+import time
+import argparse
+import itertools
+import concurrent.futures
+import config as cfg
+from traces import FeatureTrace, load_or_extract, trace_path, replay, hash_files
+
+# =========================================
+#   RECHERCHE DE PARAMETRES (GRID SEARCH)
+# =========================================
+#
+# Evalue des milliers de combinaisons de paramètres de décision sur TEST_CASES.
+# Les vidéos ne sont décodées qu'une fois (traces.py) : chaque combinaison ne
+# coûte qu'un rejeu des traces, réparti sur un pool de process.
+#
+#   python tune.py --dy-day 30:60:5 --dy-night 20:50:5 --validations 0.1,0.167,0.25
+#
+# Plage : "debut:fin:pas" (fin incluse), liste "a,b,c" ou valeur seule.
+# Sans plage, le paramètre garde sa valeur de config.py.
+
+# Option CLI -> paramètre de décision (detector.DECISION_PARAMS)
+TUNABLE = {
+    "dy_day": "DY_DAY_THRESHOLD",
+    "dy_night": "DY_NIGHT_THRESHOLD",
+    "day_min_area": "DAY_MIN_AREA",
+    "night_min_area": "NIGHT_MIN_AREA",
+    "max_dy": "MAX_DY",
+    "stride": "ANALYSIS_STRIDE_SEC",
+    "smoothing": "SMOOTHING_WINDOW_SEC",
+    "validations": "CONSECUTIVE_VALIDATIONS_SEC",
+}
+
+def parse_range(text):
+    """"30:60:5" -> [30, 35, ..., 60] ; "1,2.5" -> [1, 2.5] ; "40" -> [40]."""
+    def num(s):
+        v = float(s)
+        return int(v) if v.is_integer() and "." not in s else v
+
+    if ":" in text:
+        start, stop, step = (num(s) for s in text.split(":"))
+        if step <= 0: raise argparse.ArgumentTypeError(f"Pas invalide : {text}")
+        values, v = [], start
+        while v <= stop + step * 1e-9:
+            values.append(round(v, 6))
+            v = start + step * len(values)
+        return values
+    return [num(s) for s in text.split(",")]
+
+def build_grid(ranges):
+    """Produit cartésien des plages : liste de dicts {PARAM: valeur}."""
+    names = list(ranges)
+    return [dict(zip(names, values)) for values in itertools.product(*(ranges[n] for n in names))]
+
+# -----------------------------------------
+#   Workers
+# -----------------------------------------
+
+_traces = None  # {filename: (trace, attendu)} chargé une fois par worker
+
+def _init_worker(paths):
+    global _traces
+    _traces = {name: (FeatureTrace.load(path), expected) for name, (path, expected) in paths.items()}
+
+def evaluate(params):
+    """
+    Rejoue toutes les traces avec `params`.
+    Retourne (faux positifs, faux négatifs, {vidéo avec chute: instant de détection en s ou None}).
+    """
+    fp = fn = 0
+    fall_times = {}
+    for name, (trace, expected) in _traces.items():
+        out = replay(trace, params, stop_at_fall=True)
+        if out.detected and not expected: fp += 1
+        if expected:
+            if not out.detected: fn += 1
+            fall_times[name] = out.fall_frame / trace.source_fps if out.detected else None
+    return fp, fn, fall_times
+
+def prepare_traces(scale=None):
+    """Extrait (ou retrouve en cache) la trace de chaque vidéo, en parallèle."""
+    found = {}
+    for filename, expected in cfg.TEST_CASES.items():
+        path = os.path.join(cfg.VIDEOS_DIR, filename)
+        if os.path.exists(path): found[filename] = (path, expected)
+        else: print(f"⚠️  {filename.ljust(35)} : INTROUVABLE (ignorée)")
+
+    paths = {}
+    video_paths = [path for path, _ in found.values()]
+    hash_files(video_paths)  # Avant le pool : un seul écrivain de l'index des empreintes
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        results = executor.map(load_or_extract, video_paths, [scale] * len(found))
+        for (filename, (path, expected)), (_, cached) in zip(found.items(), results):
+            paths[filename] = (trace_path(path, scale), expected)
+            if not cached: print(f"   trace extraite : {filename}")
+    return paths
+
+# -----------------------------------------
+#   Résultats
+# -----------------------------------------
+
+def summarize(grid, outcomes, n_videos):
+    """
+    Une ligne par combinaison. Latence = retard moyen (s) des chutes détectées par
+    rapport à la détection la plus précoce de la même vidéo sur toute la grille.
+    """
+    earliest = {}
+    for _, _, times in outcomes:
+        for name, t in times.items():
+            if t is not None: earliest[name] = min(t, earliest.get(name, t))
+
+    rows = []
+    for params, (fp, fn, times) in zip(grid, outcomes):
+        delays = [t - earliest[name] for name, t in times.items() if t is not None]
+        rows.append({
+            **params,
+            "accuracy": (n_videos - fp - fn) / n_videos if n_videos else 0.0,
+            "false_positives": fp,
+            "false_negatives": fn,
+            "latency_s": sum(delays) / len(delays) if delays else float("inf"),
+        })
+    return rows
+
+def pareto_front(rows, keys=("false_positives", "false_negatives", "latency_s")):
+    """Combinaisons non dominées (à minimiser sur `keys`), une seule par jeu d'objectifs."""
+    best = {}
+    for row in rows:
+        best.setdefault(tuple(row[k] for k in keys), row)
+    points = sorted(best)
+    front = []
+    for p in points:
+        # Tri lexicographique : seul un point déjà retenu peut dominer p
+        if not any(all(q[i] <= p[i] for i in range(len(keys))) for q in front):
+            front.append(p)
+    return [best[p] for p in front]
+
+def write_rows(path, rows):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recherche des paramètres de décision sur TEST_CASES")
+    for opt, name in TUNABLE.items():
+        parser.add_argument(f"--{opt.replace('_', '-')}", type=parse_range, default=None, metavar="PLAGE",
+                            help=f"Plage pour {name} (défaut : {getattr(cfg, name)})")
+    parser.add_argument("--scale", type=float, default=None, help="Echelle d'analyse des traces")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de process (défaut : nb de coeurs)")
+    parser.add_argument("--output", default=os.path.join(cfg.OUTPUT_DIR, "tune_pareto.csv"),
+                        help="Fichier CSV du front de Pareto")
+    parser.add_argument("--all", metavar="CSV", default=None, help="Ecrit aussi toutes les combinaisons")
+    args = parser.parse_args()
+
+    ranges = {name: getattr(args, opt) or [getattr(cfg, name)] for opt, name in TUNABLE.items()}
+    grid = build_grid(ranges)
+    print(f"--- TUNING : {len(grid)} combinaisons ---")
+
+    paths = prepare_traces(args.scale)
+    if not paths:
+        print("❌ Aucune vidéo de TEST_CASES trouvée.")
+        raise SystemExit(1)
+
+    start_time = time.time()
+    with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                                                initargs=(paths,)) as executor:
+        workers = args.workers or os.cpu_count() or 1
+        chunksize = max(1, len(grid) // (workers * 8))
+        outcomes = []
+        for i, outcome in enumerate(executor.map(evaluate, grid, chunksize=chunksize), 1):
+            outcomes.append(outcome)
+            if i % max(1, len(grid) // 20) == 0 or i == len(grid):
+                print(f"\r   {i}/{len(grid)} combinaisons", end="", flush=True)
+    duration = time.time() - start_time
+    print()
+
+    rows = summarize(grid, outcomes, len(paths))
+    front = pareto_front(rows)
+    write_rows(args.output, front)
+    if args.all: write_rows(args.all, rows)
+
+    print("-" * 60)
+    print(f"TEMPS TOTAL : {duration:.2f} secondes ({len(grid) / duration:.0f} combinaisons/s)")
+    print(f"FRONT DE PARETO ({len(front)} combinaisons) -> {args.output}")
+    for row in front[:10]:
+        varied = ", ".join(f"{n}={row[n]}" for n in ranges if len(ranges[n]) > 1)
+        print(f"   {row['accuracy'] * 100:5.1f}%  FP {row['false_positives']}  FN {row['false_negatives']}  "
+              f"retard {row['latency_s']:.2f}s  {varied}")
+    print("=" * 60)